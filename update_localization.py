@@ -1,4 +1,4 @@
-#!/usr/bin/env python
+#!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
 # ------------------------------------------------------------------------------
@@ -46,16 +46,46 @@ import sys
 import tempfile
 # Running Commands on the Commandline
 import subprocess
+import shlex
+# Measuring durations
+import time
+import contextlib
+import cProfile
+import pstats
 # Opening Files with different Encodings
 import codecs
 # Commandline Options parser
 import optparse
 # High Level File Operations
 import shutil
+import filecmp
+import io
+# Matching ignore patterns
+import fnmatch
+# Running the extraction in worker processes
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 # Logging
 import logging
+# Exporting translations
+import csv
+# Extraction cache
+import sqlite3
+import hashlib
+import json
+# Memory benchmark
+import tracemalloc
+# Generated test and benchmark data
+import random
 # Doc-Tests
 import doctest
+# Parsing interface files
+from xml.etree import ElementTree
+# Memory mapped strings tables
+import mmap
+from collections.abc import Mapping
+# Sorted insertion of new keys
+import heapq
 
 # -- Class ---------------------------------------------------------------------
 
@@ -71,6 +101,8 @@ class LocalizedStringLineParser(object):
         self.key = None
         self.value = None
         self.comment = None
+        # True if the last line was neither blank nor part of an entry
+        self.unparsed = False
 
     def parse_line(self, line):
         ''' Parses a single line. Keeps track of the current state and creates
@@ -151,8 +183,32 @@ class LocalizedStringLineParser(object):
             >>> string.value
             'value'
             >>> string.comment
-            'Line 1\\n Line 2\\n Line 3 '
+            'Line 1\\n Line 2\\n Line 3'
+
+        Multiline values and comments keep the line endings of the file,
+        lines without one are joined with a newline
+
+            >>> parser = LocalizedStringLineParser()
+            >>> string = parser.parse_line('"key" = "Line 1\\r\\n')
+            >>> string = parser.parse_line('Line 2";\\r\\n')
+            >>> string.value
+            'Line 1\\r\\nLine 2'
+
+        Entries without a comment and empty values are parsed as well, lines
+        that could not be parsed set unparsed
+
+            >>> parser = LocalizedStringLineParser()
+            >>> string = parser.parse_line('"key" = "";')
+            >>> string.key, string.value, string.comment
+            ('key', '', None)
+            >>> parser.parse_line('key = value')
+            >>> parser.unparsed
+            True
         '''
+        self.unparsed = False
+        text = line.rstrip('\r\n')
+        ending = line[len(text):] or '\n'
+        line = text
         if self.parse_state == self.ParseStates['COMMENT']:
             (self.key, self.value, self.comment) = LocalizedString.parse_trailing_comment(line)
             if self.key is not None and self.value is not None and self.comment is not None:
@@ -164,20 +220,23 @@ class LocalizedStringLineParser(object):
             # Maybe its a multiline comment
             self.comment_partial = LocalizedString.parse_multiline_comment_start(line)
             if self.comment_partial is not None:
+                self.comment_partial += ending
                 self.parse_state = self.ParseStates['COMMENT_MULTILINE']
-            return None
+                return None
+            # Or an entry without a comment
+            return self.parse_entry(line, ending)
 
         elif self.parse_state == self.ParseStates['COMMENT_MULTILINE']:
             comment_end = LocalizedString.parse_multiline_comment_end(line)
             if comment_end is not None:
-                self.comment = self.comment_partial + '\n' + comment_end
+                self.comment = self.comment_partial + comment_end
                 self.comment_partial = None
                 self.parse_state = self.ParseStates['STRING']
                 return None
             # Or its just an intermediate line
             comment_line = LocalizedString.parse_multiline_comment_line(line)
             if comment_line is not None:
-                self.comment_partial = self.comment_partial + '\n' + comment_line
+                self.comment_partial += comment_line + ending
             return None
 
         elif self.parse_state == self.ParseStates['TRAILING_COMMENT']:
@@ -188,33 +247,43 @@ class LocalizedStringLineParser(object):
             return None
 
         elif self.parse_state == self.ParseStates['STRING']:
-            (self.key, self.value) = LocalizedString.parse_localized_pair(
-                line
-            )
-            if self.key is not None and self.value is not None:
-                self.parse_state = self.ParseStates['COMMENT']
-                return self.build_localizedString()
-            # Otherwise, try if the Value is multi-line
-            (self.key, self.value_partial) = LocalizedString.parse_multiline_start(
-                line
-            )
-            if self.key is not None and self.value_partial is not None:
-                self.parse_state = self.ParseStates['STRING_MULTILINE']
-                self.value = None
-            return None
+            return self.parse_entry(line, ending)
         elif self.parse_state == self.ParseStates['STRING_MULTILINE']:
             value_part = LocalizedString.parse_multiline_end(line)
             if value_part is not None:
-                self.value = self.value_partial + '\n' + value_part
+                self.value = self.value_partial + value_part
                 self.value_partial = None
                 self.parse_state = self.ParseStates['COMMENT']
                 return self.build_localizedString()
             value_part = LocalizedString.parse_multiline_line(line)
             if value_part is not None:
-                self.value_partial = self.value_partial + '\n' +  value_part
+                self.value_partial += value_part + ending
             return None
 
 
+    def parse_entry(self, line, ending='\n'):
+        ''' Parses the first line of an entry, its comment has been parsed
+        before if it has one. ending is the line ending that was stripped
+        from the line.
+        '''
+        (self.key, self.value) = LocalizedString.parse_localized_pair(
+            line
+        )
+        if self.key is not None and self.value is not None:
+            self.parse_state = self.ParseStates['COMMENT']
+            return self.build_localizedString()
+        # Otherwise, try if the Value is multi-line
+        (self.key, self.value_partial) = LocalizedString.parse_multiline_start(
+            line
+        )
+        if self.key is not None and self.value_partial is not None:
+            self.value_partial += ending
+            self.parse_state = self.ParseStates['STRING_MULTILINE']
+            self.value = None
+        elif line.strip() and not line.lstrip().startswith('//'):
+            self.unparsed = True
+        return None
+
     def build_localizedString(self):
         localizedString = LocalizedString(
             self.key,
@@ -228,27 +297,30 @@ class LocalizedStringLineParser(object):
 
 class LocalizedString(object):
     ''' A localizes string entry with key, value and comment'''
+    # Tables hold many entries, so avoid a __dict__ per entry
+    __slots__ = ('key', 'value', 'comment')
+
     COMMENT_EXPR = re.compile(
         # Line start
-        '^\w*'
-        # Comment
-        '/\* (?P<comment>.+) \*/'
+        r'^\s*'
+        # Comment, without the padding (see _comment_text)
+        r'/\* ?(?P<comment>.*?) ?\*/'
         # End of line
-        '\w*$'
+        r'\s*$'
     )
     COMMENT_MULTILINE_START = re.compile(
         # Line start
-        '^\w*'
+        r'^\s*'
         # Comment
-        '/\* (?P<comment>.+)'
+        r'/\* ?(?P<comment>.*)'
         # End of line
-        '\w*$'
+        r'\s*$'
     )
     COMMENT_MULTILINE_LINE = re.compile(
         # Line start
         '^'
         # Value
-        '(?P<comment>.+)'
+        '(?P<comment>.*)'
         # End of line
         '$'
     )
@@ -256,21 +328,21 @@ class LocalizedString(object):
         # Line start
         '^'
         # Comment
-        '(?P<comment>.+)\*/'
+        r'(?P<comment>.*?) ?\*/'
         # End of line
-        '\s*$'
+        r'\s*$'
     )
     LOCALIZED_STRING_EXPR = re.compile(
         # Line start
         '^'
         # Key
-        '"(?P<key>.+)"'
+        r'"(?P<key>(?:[^"\\]|\\.)*)"'
         # Equals
-        ' ?= ?'
+        r'\s*=\s*'
         # Value
-        '"(?P<value>.+)"'
+        r'"(?P<value>(?:[^"\\]|\\.)*)"'
         # Whitespace
-        ';'
+        r'\s*;\s*'
         # End of line
         '$'
     )
@@ -278,11 +350,11 @@ class LocalizedString(object):
         # Line start
         '^'
         # Key
-        '"(?P<key>.+)"'
+        r'"(?P<key>(?:[^"\\]|\\.)*)"'
         # Equals
-        ' ?= ?'
-        # Value
-        '"(?P<value>.+)'
+        r'\s*=\s*'
+        # Value, may end with a backslash that escapes the line break
+        r'"(?P<value>(?:[^"\\]|\\.)*\\?)'
         # End of line
         '$'
     )
@@ -290,7 +362,7 @@ class LocalizedString(object):
         # Line start
         '^'
         # Value
-        '(?P<value>.+)'
+        '(?P<value>.*)'
         # End of line
         '$'
     )
@@ -298,27 +370,49 @@ class LocalizedString(object):
         # Line start
         '^'
         # Value
-        '(?P<value>.+)"'
+        r'(?P<value>(?:[^"\\]|\\.)*)"'
         # Whitespace
-        ' ?; ?'
+        r'\s*;\s*'
         # End of line
         '$'
     )
+    # Master pattern of the whole-file scanner, every match is one token:
+    # a comment, a complete entry (with an optional trailing comment on the
+    # same line), a line comment or a run of text that could not be parsed
+    TOKEN_EXPR = re.compile(
+        r'''
+        \s*
+        (?:
+            /\*(?P<comment>.*?)\*/
+          | "(?P<key>(?:[^"\\]|\\.)*)"
+            \s*=\s*
+            "(?P<value>(?:[^"\\]|\\.)*)"
+            \s*;
+            (?:[ \t]*/\*(?P<trailing_comment>.*?)\*/)?
+          | //(?P<line_comment>[^\n]*)
+          | (?P<unknown>[^\n]+)
+        )
+        ''',
+        re.DOTALL | re.VERBOSE
+    )
+    # Unknown tokens of the scanner that start an entry or a comment which
+    # is not closed
+    UNTERMINATED_EXPR = re.compile(r'/\*|"(?:[^"\\]|\\.)*"\s*=\s*"')
     LOCALIZED_STRING_TRAILING_COMMENT_EXPR = re.compile(
         # Line start
         '^'
         # Key
-        '"(?P<key>.+)"'
+        r'"(?P<key>(?:[^"\\]|\\.)*)"'
         # Equals
-        ' ?= ?'
+        r'\s*=\s*'
         # Value
-        '"(?P<value>.+)"'
+        r'"(?P<value>(?:[^"\\]|\\.)*)"'
         # Whitespace
-        ' ?; ?'
+        r'\s*;[ \t]*'
         # Comment
-        '/\* (?P<comment>.+) \*/'
+        r'/\* ?(?P<comment>.*?) ?\*/'
         # End of line
-        '$'
+        r'\s*$'
 
     )
 
@@ -464,7 +558,7 @@ class LocalizedString(object):
         Example:
 
             >>> LocalizedString.parse_multiline_comment_end(' End */ ')
-            ' End '
+            ' End'
         '''
         result = cls.COMMENT_MULTILINE_END.match(line)
         if result is not None:
@@ -519,6 +613,8 @@ class LocalizedString(object):
             (None, None)
             >>> LocalizedString.parse_localized_pair('"key1" = "value1";')
             ('key1', 'value1')
+            >>> LocalizedString.parse_localized_pair('"key2" = "";')
+            ('key2', '')
         '''
         result = cls.LOCALIZED_STRING_EXPR.match(line)
         if result is not None:
@@ -564,6 +660,26 @@ class LocalizedString(object):
         self.value = value
         self.comment = comment
 
+    @property
+    def text(self):
+        '''The value with its escape sequences decoded, see unescape_value.
+        Setting it stores the escaped text as value.
+
+            >>> string = LocalizedString('key', 'Say \\\\"Hi\\\\" \\\\U00FC')
+            >>> print(string.text)
+            Say "Hi" ü
+            >>> string.text = 'Line 1\\nLine 2'
+            >>> print(string.value)
+            Line 1\\nLine 2
+        '''
+        if self.value is None:
+            return None
+        return unescape_value(self.value)
+
+    @text.setter
+    def text(self, text):
+        self.value = escape_value(text)
+
     def is_raw(self):
         '''
         Return True if the localized string has not been translated.
@@ -586,12 +702,798 @@ class LocalizedString(object):
         else:
             return '"%s" = "%s";\n' % (self.key or '', self.value or '')
 
+class StringsTable(dict):
+    ''' Dictionary of LocalizedStrings that were read from a strings file.
+    It remembers the encoding of the file, so it can be written back in the
+    same encoding.
+
+    Like every dictionary it keeps the order in which the keys were added.
+    is_sorted tells whether that order is sorted by key, so sort_strings does
+    not need to sort the table again. Adding a key resets it.
+
+    The parsers store the problems they found in the file in diagnostics,
+    see ParseDiagnostic.
+
+    Examples
+
+        >>> strings = parse_file('Localizable.strings')
+        >>> strings.is_sorted
+        True
+        >>> strings['key1'] = LocalizedString('key1', 'value1', 'Comment')
+        >>> strings.is_sorted
+        True
+        >>> strings['a'] = LocalizedString('a', 'a', 'Comment')
+        >>> strings.is_sorted
+        False
+    '''
+    def __init__(self, strings=(), encoding=None, is_sorted=False):
+        super(StringsTable, self).__init__(strings)
+        self.encoding = encoding or DEFAULT_ENCODING
+        self.is_sorted = is_sorted
+        self.diagnostics = []
+
+    def __setitem__(self, key, value):
+        if key not in self:
+            self.is_sorted = False
+        super(StringsTable, self).__setitem__(key, value)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self.is_sorted = False
+        return super(StringsTable, self).setdefault(key, default)
+
+    def update(self, *args, **kwargs):
+        self.is_sorted = False
+        super(StringsTable, self).update(*args, **kwargs)
+
+
+class LazyStringsTable(Mapping):
+    ''' Read-only table of the LocalizedStrings in a strings file, backed by a
+    memory map of the file.
+
+    When opened, the file is scanned once and only the keys with the byte
+    offsets of their value and comment are indexed. The LocalizedString of a
+    key is created when it is accessed, so memory stays proportional to the
+    keys rather than the contents of the file.
+
+    Examples
+
+        >>> table = LazyStringsTable('Localizable.strings')
+        >>> len(table)
+        3
+        >>> 'key1' in table
+        True
+        >>> print(table['multiline'])
+        /* Some Multiline Comment */
+        "multiline" = "Line 1\\
+        Line 2";
+        <BLANKLINE>
+        >>> dict(table.items()) == parse_file('Localizable.strings')
+        True
+        >>> table.encoding
+        'utf-16-le'
+        >>> table.is_sorted
+        True
+        >>> table.close()
+    '''
+    def __init__(self, file_path, encoding=None):
+        super(LazyStringsTable, self).__init__()
+        self.file_path = file_path
+        with open(file_path, 'rb') as file_contents:
+            if os.fstat(file_contents.fileno()).st_size > 0:
+                self.data = mmap.mmap(file_contents.fileno(), 0,
+                                      access=mmap.ACCESS_READ)
+            else:
+                self.data = b''
+        start = 0
+        if encoding is None:
+            encoding = detect_encoding(self.data[:4096])
+        for (byte_order_mark, mark_encoding) in BYTE_ORDER_MARKS:
+            if (mark_encoding == encoding and
+                    self.data[:len(byte_order_mark)] == byte_order_mark):
+                start = len(byte_order_mark)
+        self.encoding = encoding
+        self.codec = encoding.replace('-sig', '')
+        self.index = self._build_index(start)
+
+    @classmethod
+    def token_expr(cls, encoding):
+        '''Returns the scanner pattern of parse_strings for the raw bytes of
+        a file with the given encoding
+        '''
+        if encoding not in cls.TOKEN_EXPRS:
+            cls.TOKEN_EXPRS[encoding] = cls._compile_token_expr(encoding)
+        return cls.TOKEN_EXPRS[encoding]
+
+    TOKEN_EXPRS = {}
+
+    @staticmethod
+    def _compile_token_expr(encoding):
+        codec = encoding.replace('-sig', '')
+        if codec == 'utf-8':
+            # ASCII delimiters never occur within UTF-8 multi-byte sequences
+            return re.compile(LocalizedString.TOKEN_EXPR.pattern.encode('ascii'),
+                              re.DOTALL | re.VERBOSE)
+
+        def unit(chars):
+            return b''.join(re.escape(char.encode(codec)) for char in chars)
+        any_unit = b'.' * len(u' '.encode(codec))
+
+        def other(*chars):
+            return (b'(?:(?!' + b'|'.join(unit(char) for char in chars) +
+                    b')' + any_unit + b')')
+        space = b'(?:' + b'|'.join(unit(char) for char in u' \t\r\n\x0b\x0c') + b')'
+        literal = (b'(?:' + other(u'"', u'\\') + b'|' + unit(u'\\') + any_unit +
+                   b')*')
+        comment = b'(?:' + any_unit + b')*?'
+        return re.compile(
+            space + b'*(?:' +
+            unit(u'/*') + b'(?P<comment>' + comment + b')' + unit(u'*/') +
+            b'|' + unit(u'"') + b'(?P<key>' + literal + b')' + unit(u'"') +
+            space + b'*' + unit(u'=') + space + b'*' +
+            unit(u'"') + b'(?P<value>' + literal + b')' + unit(u'"') +
+            space + b'*' + unit(u';') +
+            b'(?:(?:' + unit(u' ') + b'|' + unit(u'\t') + b')*' + unit(u'/*') +
+            b'(?P<trailing_comment>' + comment + b')' + unit(u'*/') + b')?' +
+            b'|' + unit(u'//') + b'(?P<line_comment>' + other(u'\n') + b'*)' +
+            b'|(?P<unknown>' + other(u'\n') + b'+))',
+            re.DOTALL
+        )
+
+    def _build_index(self, position):
+        token_expr = self.token_expr(self.encoding)
+        data = self.data
+        index = {}
+        previous_key = None
+        # See StringsTable
+        self.is_sorted = True
+        comment_span = (-1, -1)
+        # Matching token by token keeps the scanner aligned to code units
+        match = token_expr.match(data, position)
+        while match is not None and match.end() > position:
+            token = match.lastgroup
+            if token == 'value' or token == 'trailing_comment':
+                if token == 'trailing_comment':
+                    comment_span = match.span('trailing_comment')
+                key = data[match.start('key'):match.end('key')].decode(self.codec)
+                if previous_key is not None and key < previous_key:
+                    self.is_sorted = False
+                previous_key = key
+                index[key] = (comment_span + match.span('value'))
+                comment_span = (-1, -1)
+            elif token == 'comment':
+                comment_span = match.span('comment')
+            position = match.end()
+            match = token_expr.match(data, position)
+        return index
+
+    def __getitem__(self, key):
+        (comment_start, comment_end, value_start, value_end) = self.index[key]
+        comment = None
+        if comment_start >= 0:
+            comment = _comment_text(
+                self.data[comment_start:comment_end].decode(self.codec)
+            )
+        value = self.data[value_start:value_end].decode(self.codec)
+        return LocalizedString(key, value, comment)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def close(self):
+        '''Closes the memory map of the file'''
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class ExtractionCache(object):
+    ''' Persistent index of the strings extracted from each source file.
+
+    For every source file the modification time, size and content hash are
+    stored together with the extracted entries in a SQLite database. A file
+    whose modification time and size did not change is served from the cache,
+    a file that was only touched is recognized by its unchanged hash.
+
+    Examples
+
+        >>> folder_path = tempfile.mkdtemp()
+        >>> source_path = os.path.join(folder_path, 'test.m')
+        >>> _ = shutil.copy('TestInput/test.m', source_path)
+        >>> cache = ExtractionCache(os.path.join(folder_path, CACHE_FILE_NAME))
+        >>> cache.lookup(source_path)
+        >>> cache.store(source_path, extract_file(source_path))
+        >>> tables = cache.lookup(source_path)
+        >>> tables == extract_file(source_path)
+        True
+        >>> with open(source_path, 'a') as source:
+        ...     _ = source.write('NSLocalizedString(@"new", nil);')
+        >>> cache.lookup(source_path)
+        >>> cache.close()
+        >>> shutil.rmtree(folder_path)
+    '''
+    # Increase when the extraction changes, to invalidate existing caches
+    VERSION = 2
+
+    def __init__(self, path):
+        super(ExtractionCache, self).__init__()
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)'
+        )
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, '
+            'mtime REAL, size INTEGER, hash TEXT, entries TEXT)'
+        )
+        row = self.connection.execute(
+            "SELECT value FROM meta WHERE name = 'version'"
+        ).fetchone()
+        if row is None or row[0] != str(self.VERSION):
+            logging.debug('Resetting extraction cache {}'.format(path))
+            self.connection.execute('DELETE FROM files')
+            self.connection.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('version', ?)",
+                (str(self.VERSION),)
+            )
+
+    @staticmethod
+    def file_hash(file_path):
+        '''Returns the hex digest of the contents of the file'''
+        with open(file_path, 'rb') as file_contents:
+            return hashlib.sha1(file_contents.read()).hexdigest()
+
+    @staticmethod
+    def encode_tables(tables):
+        '''Serializes extracted tables for the cache'''
+        return json.dumps(dict(
+            (table_name, [(string.key, string.value, string.comment)
+                          for string in strings.values()])
+            for table_name, strings in tables.items()
+        ))
+
+    @staticmethod
+    def decode_tables(entries):
+        '''Creates extracted tables from their serialized form'''
+        tables = {}
+        for table_name, strings in json.loads(entries).items():
+            table = tables[table_name] = {}
+            for (key, value, comment) in strings:
+                table[key] = LocalizedString(key, value, comment)
+        return tables
+
+    def lookup(self, file_path):
+        '''Returns the tables extracted from the file if the file did not
+        change since they were stored, None otherwise
+        '''
+        row = self.connection.execute(
+            'SELECT mtime, size, hash, entries FROM files WHERE path = ?',
+            (file_path,)
+        ).fetchone()
+        if row is None:
+            return None
+        (mtime, size, file_hash, entries) = row
+        stat = os.stat(file_path)
+        if stat.st_size != size:
+            return None
+        if stat.st_mtime != mtime:
+            if self.file_hash(file_path) != file_hash:
+                return None
+            self.connection.execute(
+                'UPDATE files SET mtime = ? WHERE path = ?',
+                (stat.st_mtime, file_path)
+            )
+        return self.decode_tables(entries)
+
+    def store(self, file_path, tables):
+        '''Stores the tables extracted from the file'''
+        stat = os.stat(file_path)
+        self.connection.execute(
+            'INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)',
+            (file_path, stat.st_mtime, stat.st_size, self.file_hash(file_path),
+             self.encode_tables(tables))
+        )
+
+    def prune(self, file_paths):
+        '''Removes all files that are not in file_paths from the cache'''
+        file_paths = set(file_paths)
+        stale_paths = [(path,) for (path,) in
+                       self.connection.execute('SELECT path FROM files')
+                       if path not in file_paths]
+        self.connection.executemany('DELETE FROM files WHERE path = ?',
+                                    stale_paths)
+
+    def close(self):
+        '''Writes all changes to disk and closes the cache'''
+        self.connection.commit()
+        self.connection.close()
+
+
+class RetentionArchive(object):
+    ''' Strings that were removed from the tables of a folder, kept in a JSON
+    file next to the strings files. When a removed key is used again, its
+    translation is restored from the archive. Strings that were not seen for
+    longer than max_age seconds are evicted.
+
+    Keyword arguments:
+
+        path
+            Path of the archive file, see ARCHIVE_FILE_NAME
+
+        max_age
+            Seconds after which removed strings are dropped from the archive
+
+        now
+            The current time, defaults to time.time()
+
+    Examples
+
+        >>> folder_path = tempfile.mkdtemp()
+        >>> archive_path = os.path.join(folder_path, ARCHIVE_FILE_NAME)
+        >>> old = {'a': LocalizedString('a', 'A', 'Comment'),
+        ...        'b': LocalizedString('b', 'B', 'Comment')}
+        >>> archive = RetentionArchive(archive_path, max_age=60, now=1000)
+        >>> merged = {'b': old['b']}
+        >>> archive.apply('Localizable', old, merged)
+        (1, 0)
+        >>> archive.save()
+        >>> archive = RetentionArchive(archive_path, max_age=60, now=1030)
+        >>> merged = {'a': LocalizedString('a', 'a', 'New'), 'b': old['b']}
+        >>> archive.apply('Localizable', merged, merged)
+        (0, 0)
+        >>> archive.apply('Localizable', {'b': old['b']}, merged)
+        (0, 1)
+        >>> print('{} {}'.format(merged['a'].value, merged['a'].comment))
+        A New
+        >>> archive.apply('Localizable', old, {})
+        (2, 0)
+        >>> archive.save()
+        >>> sorted(RetentionArchive(archive_path, max_age=60, now=1100).tables)
+        []
+        >>> shutil.rmtree(folder_path)
+    '''
+    # Increase when the format changes, to discard existing archives
+    VERSION = 1
+
+    def __init__(self, path, max_age, now=None):
+        super(RetentionArchive, self).__init__()
+        self.path = path
+        self.max_age = max_age
+        self.now = time.time() if now is None else now
+        # table name -> key -> {'value', 'comment', 'last_seen'}
+        self.tables = {}
+        self.changed = False
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as archive_file:
+                contents = json.load(archive_file)
+            if contents.get('version') == self.VERSION:
+                self.tables = contents['tables']
+            else:
+                logging.debug('Discarding archive {}'.format(path))
+                self.changed = True
+        self.evict()
+
+    def evict(self):
+        '''Drops the strings that were not seen for longer than max_age'''
+        oldest = self.now - self.max_age
+        for table_name in list(self.tables):
+            entries = self.tables[table_name]
+            for key in [key for key, entry in entries.items()
+                        if entry['last_seen'] < oldest]:
+                logging.debug('Evicting %s from the archive of %s', key,
+                              table_name)
+                del entries[key]
+                self.changed = True
+            if not entries:
+                del self.tables[table_name]
+
+    def apply(self, table_name, old_strings, merged_strings):
+        '''Archives the strings of old_strings that are not in merged_strings
+        and restores archived translations of the new strings of
+        merged_strings, the comments of the new strings are kept
+
+        Returns
+            ``tuple`` with the number of archived and restored strings
+        '''
+        entries = self.tables.get(table_name, {})
+        restored = 0
+        for key, localized_string in merged_strings.items():
+            if key in entries and key not in old_strings:
+                entry = entries.pop(key)
+                # Like an old string in merge_strings, a translated value
+                # wins over the new one
+                if entry['value'] != key:
+                    merged_strings[key] = LocalizedString(
+                        key, entry['value'], localized_string.comment
+                    )
+                restored += 1
+        archived = 0
+        for key in old_strings:
+            if key not in merged_strings:
+                localized_string = old_strings[key]
+                entries[key] = {'value': localized_string.value,
+                                'comment': localized_string.comment,
+                                'last_seen': self.now}
+                archived += 1
+        if entries:
+            self.tables[table_name] = entries
+        else:
+            self.tables.pop(table_name, None)
+        if archived or restored:
+            logging.info('%s: archived %d, restored %d strings', table_name,
+                         archived, restored)
+            self.changed = True
+        return (archived, restored)
+
+    def save(self):
+        '''Writes the archive if it changed'''
+        if self.changed:
+            contents = json.dumps({'version': self.VERSION,
+                                   'tables': self.tables},
+                                  indent=1, sort_keys=True)
+            write_atomic(self.path, contents.encode('utf-8'))
+            self.changed = False
+
+
+class TableCache(object):
+    ''' Parsed strings files of a folder, stored as JSON next to them. The
+    cache is usually committed with the strings files, so it is not loaded
+    with pickle, which would run code from whoever wrote the file.
+
+    A strings file whose modification time and size did not change since it
+    was parsed is loaded from the cache instead of being parsed again, a file
+    that was only touched is recognized by its unchanged hash (see
+    ExtractionCache).
+
+    Examples
+
+        >>> folder_path = tempfile.mkdtemp()
+        >>> file_path = os.path.join(folder_path, 'Localizable.strings')
+        >>> _ = shutil.copy('Localizable.strings', file_path)
+        >>> cache = TableCache(os.path.join(folder_path, TABLE_CACHE_FILE_NAME))
+        >>> strings = cache.parse_file(file_path)
+        >>> cache.save()
+        >>> cache = TableCache(os.path.join(folder_path, TABLE_CACHE_FILE_NAME))
+        >>> cached = cache.parse_file(file_path)
+        >>> cached == strings, cached.encoding, cached.is_sorted
+        (True, 'utf-16-le', True)
+        >>> STATS.record('table_cache', 'Localizable')['entries']
+        3
+        >>> with open(cache.path, 'w') as cache_file:
+        ...     _ = cache_file.write('{"version": 2, "tables": {"a": [1]}}')
+        >>> TableCache(cache.path).tables
+        {}
+        >>> shutil.rmtree(folder_path)
+    '''
+    # Increase when the parsers or the format change, to invalidate existing
+    # caches
+    VERSION = 2
+
+    def __init__(self, path):
+        super(TableCache, self).__init__()
+        self.path = path
+        # file name -> (mtime, size, hash, encoding, is_sorted, entries)
+        self.tables = {}
+        self.changed = False
+        try:
+            with open(path, encoding='utf-8') as cache_file:
+                contents = json.load(cache_file)
+            if contents.get('version') == self.VERSION:
+                # Unpacked to check the structure, and as JSON has no tuples
+                self.tables = dict(
+                    (file_name, (mtime, size, file_hash, encoding, is_sorted,
+                                 [(key, value, comment)
+                                  for (key, value, comment) in entries]))
+                    for file_name, (mtime, size, file_hash, encoding,
+                                    is_sorted, entries)
+                    in contents['tables'].items()
+                )
+        except FileNotFoundError:
+            pass
+        except Exception as error:
+            logging.debug('Discarding table cache {}: {}'.format(path, error))
+
+    def parse_file(self, file_path, engine='scanner', strict=False):
+        '''Returns the strings of the file like parse_file does, from the
+        cache if the file did not change. Files with diagnostics are not
+        cached, so they are reported again in each run.
+        '''
+        file_name = os.path.basename(file_path)
+        table_name = os.path.splitext(file_name)[0]
+        stat = os.stat(file_path)
+        entry = self.tables.get(file_name)
+        if entry is not None and entry[:2] != (stat.st_mtime, stat.st_size):
+            if (entry[1] == stat.st_size and
+                    entry[2] == ExtractionCache.file_hash(file_path)):
+                # Only touched
+                self.tables[file_name] = (stat.st_mtime,) + entry[1:]
+                self.changed = True
+            else:
+                entry = None
+        if entry is None:
+            strings = parse_file(file_path, engine=engine, strict=strict)
+            if strings.diagnostics:
+                self.discard(file_path)
+                return strings
+            self.tables[file_name] = (
+                stat.st_mtime, stat.st_size, ExtractionCache.file_hash(file_path),
+                strings.encoding, strings.is_sorted,
+                [(localized_string.key, localized_string.value,
+                  localized_string.comment)
+                 for localized_string in strings.values()]
+            )
+            self.changed = True
+            return strings
+
+        logging.debug('Loading {} from the table cache'.format(file_path))
+        (_, _, _, encoding, is_sorted, entries) = entry
+        with STATS.stage('table_cache', table_name) as record:
+            strings = StringsTable(
+                ((key, LocalizedString(key, value, comment))
+                 for (key, value, comment) in entries),
+                encoding, is_sorted
+            )
+            record['entries'] += len(strings)
+            record['files'] += 1
+        return strings
+
+    def discard(self, file_path):
+        '''Removes a file from the cache, e.g. after it was written'''
+        if self.tables.pop(os.path.basename(file_path), None) is not None:
+            self.changed = True
+
+    def save(self):
+        '''Writes the cache if it changed'''
+        if self.changed:
+            contents = json.dumps({'version': self.VERSION,
+                                   'tables': self.tables},
+                                  separators=(',', ':'))
+            write_atomic(self.path, contents.encode('utf-8'))
+            self.changed = False
+
+
+class Stats(object):
+    ''' Collects the wall time and counters of each stage of a run, e.g.
+    find_sources, genstrings, parse_file, merge_strings and write_file,
+    separately for each table.
+
+    Examples
+
+        >>> stats = Stats()
+        >>> with stats.stage('parse_file', 'Localizable') as record:
+        ...     record['entries'] += 3
+        >>> with stats.stage('parse_file', 'Localizable') as record:
+        ...     record['entries'] += 2
+        >>> with stats.stage('find_sources') as record:
+        ...     record['files'] += 4
+        >>> for row in stats.rows():
+        ...     print('{stage} {table} {calls} {entries} {files}'.format(**row))
+        find_sources None 1 0 4
+        parse_file Localizable 2 5 0
+    '''
+    COUNTERS = ('entries', 'bytes_read', 'bytes_written', 'files')
+
+    def __init__(self):
+        super(Stats, self).__init__()
+        self.records = {}
+
+    def record(self, stage, table=None):
+        '''Returns the record of the stage and table, it is created with all
+        counters at 0 when it is used the first time
+        '''
+        key = (stage, table)
+        if key not in self.records:
+            record = dict((counter, 0) for counter in self.COUNTERS)
+            record.update(calls=0, seconds=0.0)
+            self.records[key] = record
+        return self.records[key]
+
+    @contextlib.contextmanager
+    def stage(self, stage, table=None):
+        '''Measures the wall time of the block, the counters of the yielded
+        record can be increased in the block
+        '''
+        record = self.record(stage, table)
+        start_time = time.time()
+        try:
+            yield record
+        finally:
+            record['calls'] += 1
+            record['seconds'] += time.time() - start_time
+
+    def update(self, records):
+        '''Adds the records of another Stats object, e.g. from a worker
+        process
+        '''
+        for (stage, table), other in records.items():
+            record = self.record(stage, table)
+            for name, value in other.items():
+                record[name] += value
+
+    def clear(self):
+        '''Removes all records'''
+        self.records = {}
+
+    def rows(self):
+        '''Returns the records as list of ``dict`` sorted by stage and table'''
+        rows = []
+        for (stage, table) in sorted(self.records,
+                                     key=lambda key: (key[0], key[1] or '')):
+            row = dict(self.records[(stage, table)])
+            row.update(stage=stage, table=table)
+            rows.append(row)
+        return rows
+
+    def summary(self):
+        '''Returns the records as a table with one line per stage and table'''
+        columns = ('stage', 'table', 'calls', 'seconds') + self.COUNTERS
+        lines = ['{:<18} {:<24} {:>6} {:>9} {:>9} {:>12} {:>13} {:>6}'.format(
+            *columns)]
+        for row in self.rows():
+            lines.append(
+                '{stage:<18} {table:<24} {calls:>6} {seconds:>9.3f} '
+                '{entries:>9} {bytes_read:>12} {bytes_written:>13} '
+                '{files:>6}'.format(**dict(row, table=row['table'] or '-'))
+            )
+        return '\n'.join(lines)
+
+
+# Stats of the current run, see --stats and --stats-json
+STATS = Stats()
+
+
+class KeyIndex(object):
+    ''' Index of the keys of all tables that were merged in a run. For every
+    key it keeps the table, locale and value of each occurrence, so keys
+    that are used in several tables, keys with conflicting values and keys
+    that are missing in some locales can be reported without reading the
+    strings files again.
+
+    The index is only filled while it is enabled, see --index-report.
+
+    Examples
+
+        >>> index = KeyIndex(enabled=True)
+        >>> index.add_table('Localizable', 'de', {
+        ...     'ok': LocalizedString('ok', 'OK'),
+        ...     'cancel': LocalizedString('cancel', 'Abbrechen')})
+        >>> index.add_table('Interface', 'de', {
+        ...     'ok': LocalizedString('ok', 'Gut')})
+        >>> index.add_table('Localizable', 'en', {
+        ...     'ok': LocalizedString('ok', 'OK')})
+        >>> index.duplicates()
+        {'ok': ['Interface', 'Localizable']}
+        >>> index.conflicts()
+        {'ok': {'de': {'Localizable': 'OK', 'Interface': 'Gut'}}}
+        >>> index.missing()
+        {'en': {'Interface': ['ok'], 'Localizable': ['cancel']}}
+    '''
+    def __init__(self, enabled=False):
+        super(KeyIndex, self).__init__()
+        self.enabled = enabled
+        # key -> list of (table, locale, value)
+        self.entries = {}
+
+    def add(self, table, locale, localized_string):
+        '''Adds one LocalizedString of a table in a locale'''
+        if self.enabled:
+            self.entries.setdefault(localized_string.key, []).append(
+                (table, locale, localized_string.value)
+            )
+
+    def add_table(self, table, locale, strings):
+        '''Adds all LocalizedStrings of a table in a locale'''
+        if self.enabled:
+            for localized_string in strings.values():
+                self.add(table, locale, localized_string)
+
+    def update(self, entries):
+        '''Adds the entries of another KeyIndex, e.g. from a worker process'''
+        for key, occurrences in entries.items():
+            self.entries.setdefault(key, []).extend(occurrences)
+
+    def clear(self):
+        '''Removes all entries'''
+        self.entries = {}
+
+    def discard(self, table, locale):
+        '''Removes the entries of a table in a locale'''
+        for key in list(self.entries):
+            occurrences = [occurrence for occurrence in self.entries[key]
+                           if occurrence[:2] != (table, locale)]
+            if occurrences:
+                self.entries[key] = occurrences
+            else:
+                del self.entries[key]
+
+    def duplicates(self):
+        '''Returns the keys that are used in more than one table, mapped to
+        the sorted names of the tables
+        '''
+        duplicates = {}
+        for key, occurrences in self.entries.items():
+            tables = set(table for (table, _, _) in occurrences)
+            if len(tables) > 1:
+                duplicates[key] = sorted(tables)
+        return duplicates
+
+    def conflicts(self):
+        '''Returns the keys that have different values in the tables of the
+        same locale, mapped to the values of each table in those locales
+        '''
+        conflicts = {}
+        for key, occurrences in self.entries.items():
+            by_locale = {}
+            for (table, locale, value) in occurrences:
+                by_locale.setdefault(locale, {})[table] = value
+            for locale, values in by_locale.items():
+                if len(set(values.values())) > 1:
+                    conflicts.setdefault(key, {})[locale] = values
+        return conflicts
+
+    def missing(self):
+        '''Returns for each locale the keys that other locales have in a table
+        but the locale does not, as sorted list per table
+        '''
+        locales = set()
+        locales_by_table_key = {}
+        for key, occurrences in self.entries.items():
+            for (table, locale, _) in occurrences:
+                locales.add(locale)
+                locales_by_table_key.setdefault((table, key), set()).add(locale)
+        missing = {}
+        for (table, key), key_locales in locales_by_table_key.items():
+            for locale in locales - key_locales:
+                missing.setdefault(locale, {}).setdefault(table, []).append(key)
+        for tables in missing.values():
+            for keys in tables.values():
+                keys.sort()
+        return missing
+
+    def report(self):
+        '''Returns the duplicates, conflicts and missing keys as ``dict``'''
+        return {
+            'keys': len(self.entries),
+            'duplicates': self.duplicates(),
+            'conflicts': self.conflicts(),
+            'missing': self.missing(),
+        }
+
+
+# Keys of the tables merged in the current run, see --index-report
+KEY_INDEX = KeyIndex()
+
+
 # -- Methods -------------------------------------------------------------------
 
 ENCODINGS = ['utf16', 'utf8']
 
-
-def merge_strings(old_strings, new_strings, keep_comment=False):
+# Encoding of new strings files, always written with a byte order mark
+DEFAULT_ENCODING = 'utf-16-le'
+
+# Byte order marks and the encodings they indicate, UTF-32 before UTF-16
+# because the UTF-32-LE mark starts with the UTF-16-LE mark
+BYTE_ORDER_MARKS = [
+    (codecs.BOM_UTF32_LE, 'utf-32-le'),
+    (codecs.BOM_UTF32_BE, 'utf-32-be'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16-le'),
+    (codecs.BOM_UTF16_BE, 'utf-16-be'),
+]
+
+def merge_strings(old_strings, new_strings, keep_comment=False,
+                  keep_removed=False):
     '''Merges two dictionarys, one with the old strings and one with the new
     strings.
     Old strings keep their value but their comment will be updated. Only if
@@ -614,9 +1516,17 @@ def merge_strings(old_strings, new_strings, keep_comment=False):
             translating Storyboard files because they have generated comments
             which are not very helpfull
 
+        keep_removed
+            If True, old strings that are not in the new strings are kept
+            instead of being removed. This is necessary if the new strings
+            were only extracted from a part of the sources
+
     Returns
 
-        Merged Dictionary
+        Merged ``StringsTable`` in the encoding of old_strings. If the old
+        strings are sorted (see StringsTable), the new keys are inserted at
+        their sorted positions, so the result does not need to be sorted
+        again.
 
     Examples:
 
@@ -646,6 +1556,8 @@ def merge_strings(old_strings, new_strings, keep_comment=False):
         'key4'
         >>> merge_dict['key4'].comment
         'comment4'
+        >>> len(new_dict), new_dict['key2'].value
+        (4, 'key2')
 
         >>> old_dict_2 = {}
         >>> new_dict_2 = {}
@@ -663,263 +1575,3156 @@ def merge_strings(old_strings, new_strings, keep_comment=False):
         'value1'
         >>> merged_2['key1'].comment
         'comment1'
+
+        >>> sorted(merge_strings(old_dict, {}).keys())
+        []
+        >>> sorted(merge_strings(old_dict, {}, keep_removed=True).keys())
+        ['key1', 'key2', 'key3']
+
+        >>> old_table = StringsTable(old_dict, is_sorted=True)
+        >>> merged = merge_strings(old_table, new_dict)
+        >>> list(merged.keys()), merged.is_sorted
+        (['key1', 'key2', 'key3', 'key4'], True)
     '''
     merged_strings = {}
-    for key, old_string in old_strings.iteritems():
+    for key, old_string in old_strings.items():
         if key in new_strings:
             new_string = new_strings[key]
             if old_string.is_raw():
                 # if the old string is raw just take the new string
-                if keep_comment:
-                    new_string.comment = old_string.comment
-                merged_strings[key] = new_string
+                value = new_string.value
             else:
                 # otherwise take the value of the old string but the comment of the new string
-                new_string.value = old_string.value
-                if keep_comment:
-                    new_string.comment = old_string.comment
-                merged_strings[key] = new_string
-            # remove the string from the new strings
-            del new_strings[key]
-        else:
-            # If the String is not in the new Strings anymore it has been removed
-            # TODO: Include option to not remove old keys!
-            pass
-    # All strings that are still in the new_strings dict are really new and can be copied
-    for key, new_string in new_strings.iteritems():
-        merged_strings[key] = new_string
+                value = old_string.value
+            if keep_comment:
+                comment = old_string.comment
+            else:
+                comment = new_string.comment
+            # the new strings are left untouched, so they can be merged into
+            # the tables of several locales
+            merged_strings[key] = LocalizedString(key, value, comment)
+        elif keep_removed:
+            merged_strings[key] = old_string
+        # Otherwise the String is not in the new Strings anymore, it has been
+        # removed
+    # All strings that are not merged yet are really new and can be copied
+    new_keys = [key for key in new_strings if key not in merged_strings]
+    encoding = getattr(old_strings, 'encoding', None)
+    if getattr(old_strings, 'is_sorted', False):
+        # The merged strings are in the sorted order of the old strings, so
+        # only the new keys have to be sorted and inserted
+        new_keys.sort()
+        order = heapq.merge(list(merged_strings), new_keys)
+        for key in new_keys:
+            merged_strings[key] = new_strings[key]
+        return StringsTable(((key, merged_strings[key]) for key in order),
+                            encoding, is_sorted=True)
+    for key in new_keys:
+        merged_strings[key] = new_strings[key]
+    return StringsTable(merged_strings, encoding)
+
+
+def _unique_sorted(strings, name):
+    '''Yields the LocalizedStrings of a stream sorted by key, of several
+    strings with the same key only the last one (like in a dictionary).
+    Raises ``ValueError`` if the stream is not sorted.
+    '''
+    previous = None
+    for localized_string in strings:
+        if previous is not None:
+            if localized_string.key < previous.key:
+                raise ValueError('The {} strings are not sorted by key at {!r}'
+                                 .format(name, localized_string.key))
+            if localized_string.key != previous.key:
+                yield previous
+        previous = localized_string
+    if previous is not None:
+        yield previous
+
+
+def merge_sorted(old_strings, new_strings, keep_comment=False,
+                 keep_removed=False):
+    '''Merges two streams of LocalizedStrings that are sorted by key, like
+    merge_strings does with dictionaries. The streams are read one string at
+    a time and the merged strings are yielded in the order of their keys, so
+    only one string of each stream is kept in memory.
 
-    return merged_strings
+    Keyword arguments:
 
+        old_strings
+            Iterable with the strings that were already there, e.g. iter_file
 
-def parse_file(file_path, encoding='utf16'):
-    ''' Parses a file and creates a dictionary containing all LocalizedStrings
-        elements in the file
+        new_strings
+            Iterable with the new strings
 
-        Keyword arguments:
+        keep_comment, keep_removed
+            See merge_strings
 
-            file_path
-                path to the file that should be parsed
+    Returns
+        Generator of the merged LocalizedStrings, raises ``ValueError`` when
+        it reaches a string that is not in order
+
+    Examples
+
+        >>> old = [LocalizedString('a', 'A', 'old'),
+        ...        LocalizedString('b', 'b', 'old'),
+        ...        LocalizedString('c', 'C', 'old')]
+        >>> new = [LocalizedString('b', 'B', 'new'),
+        ...        LocalizedString('c', 'c', 'new'),
+        ...        LocalizedString('d', 'd', 'new')]
+        >>> for string in merge_sorted(old, new):
+        ...     print('{} {} {}'.format(string.key, string.value, string.comment))
+        b B new
+        c C new
+        d d new
+        >>> [string.key for string in merge_sorted(old, new, keep_removed=True)]
+        ['a', 'b', 'c', 'd']
+        >>> merged = dict((string.key, string) for string in merge_sorted(old, new))
+        >>> merged == merge_strings(dict((string.key, string) for string in old),
+        ...                         dict((string.key, string) for string in new))
+        True
+        >>> list(merge_sorted(reversed(old), new))
+        Traceback (most recent call last):
+        ...
+        ValueError: The old strings are not sorted by key at 'b'
+    '''
+    old_strings = _unique_sorted(old_strings, 'old')
+    new_strings = _unique_sorted(new_strings, 'new')
+    old_string = next(old_strings, None)
+    new_string = next(new_strings, None)
+    while old_string is not None or new_string is not None:
+        if new_string is None or (old_string is not None and
+                                  old_string.key < new_string.key):
+            # The String is not in the new Strings anymore
+            if keep_removed:
+                yield old_string
+            old_string = next(old_strings, None)
+        elif old_string is None or new_string.key < old_string.key:
+            # The String is new
+            yield new_string
+            new_string = next(new_strings, None)
+        else:
+            if old_string.is_raw():
+                value = new_string.value
+            else:
+                value = old_string.value
+            if keep_comment:
+                comment = old_string.comment
+            else:
+                comment = new_string.comment
+            yield LocalizedString(old_string.key, value, comment)
+            old_string = next(old_strings, None)
+            new_string = next(new_strings, None)
 
-            encoding
-                encoding of the file
 
-        Returns:    ``dict``
-    '''
-    
-    with codecs.open(file_path, mode='r', encoding=encoding) as file_contents:
-        logging.debug("Parsing File: {}".format(file_path))
-        parser = LocalizedStringLineParser()
-        localized_strings = {}
-        try:
-            for line in file_contents:
-                localized_string = parser.parse_line(line)
-                if localized_string is not None:
-                    localized_strings[localized_string.key] = localized_string
-        except UnicodeError:
-            logging.debug("Failed to open file as UTF16, Trying UTF8")
-            file_contents = codecs.open(file_path, mode='r', encoding='utf8')
-            for line in file_contents:
-                localized_string = parser.parse_line(line)
-                if localized_string is not None:
-                    localized_strings[localized_string.key] = localized_string
-    return localized_strings
-
-
-def write_file(file_path, strings, encoding='utf16'):
-    '''Writes the strings to the given file
-    '''
-    with codecs.open(file_path, 'w', encoding) as output:
-        for string in sort_strings(strings):
-            output.write('%s\n' % string)
+PARSER_ENGINES = ('scanner', 'line')
+
+
+class ParseDiagnostic(object):
+    ''' A problem found while parsing a strings file, see DIAGNOSTIC_KINDS
 
+    The parsers only record the character offset of the problem in the
+    decoded contents. The line number is counted once a table has
+    diagnostics and the byte offset in the file is set by parse_file, so
+    files without problems are parsed at full speed.
 
-def strings_to_file(localized_strings, file_path, encoding='utf16'):
+        >>> diagnostic = ParseDiagnostic('unparsed', 10, 'key = value')
+        >>> diagnostic.line = 3
+        >>> print(diagnostic)
+        <strings>:3: unparsed text 'key = value'
     '''
-    Write a strings file at file_path containing string in
-    the localized_strings dictionnary.
-    The strings are alphabetically sorted.
+    __slots__ = ('kind', 'offset', 'text', 'line', 'byte_offset', 'file_path')
+
+    def __init__(self, kind, offset, text, line=None):
+        super(ParseDiagnostic, self).__init__()
+        self.kind = kind
+        self.offset = offset
+        self.text = text
+        self.line = line
+        self.byte_offset = None
+        self.file_path = None
+
+    def __str__(self):
+        text = self.text
+        if len(text) > 60:
+            text = text[:57] + '...'
+        return '{}:{}: {} {!r}'.format(self.file_path or '<strings>', self.line,
+                                       DIAGNOSTIC_KINDS[self.kind], text)
+
+
+# Kinds of ParseDiagnostics with their description
+DIAGNOSTIC_KINDS = {
+    # Text that is neither an entry nor a comment, it is skipped
+    'unparsed': 'unparsed text',
+    # An entry or comment that is not closed until the end of the file
+    'unterminated': 'unterminated entry or comment',
+    # A key that occurs more than once, the last entry is used
+    'duplicate': 'duplicate key',
+}
+
+
+class ParseError(ValueError):
+    ''' Raised by parse_file in strict mode if the file has diagnostics
+
+        >>> error = ParseError([ParseDiagnostic('duplicate', 0, 'key', 1)])
+        >>> print(error)
+        <strings>:1: duplicate key 'key'
+        >>> error.diagnostics[0].kind
+        'duplicate'
     '''
-    with codecs.open(file_path, 'w', encoding) as output:
-        for localized_string in sorted_strings_from_dict(localized_strings):
-            output.write('%s\n' % localized_string)
+    def __init__(self, diagnostics):
+        super(ParseError, self).__init__(diagnostics)
+        self.diagnostics = diagnostics
 
+    def __str__(self):
+        return '\n'.join(str(diagnostic) for diagnostic in self.diagnostics)
 
-def sort_strings(strings):
-    '''Returns an array that contains all LocalizedStrings objects of the
-    dictionary, sorted alphabetically
+
+def locate_diagnostics(diagnostics, contents):
+    '''Sets the line numbers of the diagnostics from their offsets in the
+    contents, counting the lines only once up to the last diagnostic
     '''
-    keys = strings.keys()
-    keys.sort()
+    line = 1
+    position = 0
+    for diagnostic in sorted(diagnostics, key=lambda item: item.offset):
+        line += contents.count('\n', position, diagnostic.offset)
+        position = diagnostic.offset
+        if diagnostic.line is None:
+            diagnostic.line = line
 
-    values = []
-    for key in keys:
-        values.append(strings[key])
 
-    return values
+def escape_value(text):
+    '''Escapes text for a quoted value of a strings file, see unescape_value
 
+        >>> print(escape_value('Say "Hi"\\nor \\\\o/'))
+        Say \\"Hi\\"\\nor \\\\o/
+    '''
+    return (text.replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n').replace('\r', '\\r').replace('\t', '\\t'))
+
+
+# Escape sequences of strings files: \UXXXX or \uXXXX with a UTF-16 code unit,
+# up to three octal digits or a single character
+UNESCAPE_EXPR = re.compile(r'\\(?:[uU]([0-9a-fA-F]{4})|([0-7]{1,3})|(.))',
+                           re.DOTALL)
+SURROGATE_EXPR = re.compile(u'[\ud800-\udfff]')
+ESCAPED_CHARACTERS = {'a': '\a', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r',
+                      't': '\t', 'v': '\v'}
+
+
+def _unescape_match(match):
+    (code_unit, octal, character) = match.groups()
+    if code_unit is not None:
+        return chr(int(code_unit, 16))
+    if octal is not None:
+        return chr(int(octal, 8))
+    # Quotes, backslashes and escaped line breaks stand for themselves
+    return ESCAPED_CHARACTERS.get(character, character)
+
+
+def unescape_value(value):
+    '''Decodes the escape sequences of a key or value as it is written in a
+    strings file. Characters outside the BMP may be written as a pair of
+    \\U escaped surrogates.
+
+    The parsers keep keys and values as they are written in the file, so
+    unchanged entries are written back byte for byte. This is only needed
+    where the text itself matters, see LocalizedString.text.
+
+        >>> print(unescape_value('Say \\\\"Hi\\\\" or \\\\\\\\o/ \\\\U00FC \\\\UD83D\\\\UDE00'))
+        Say "Hi" or \\o/ ü 😀
+        >>> unescape_value('Line 1\\\\nLine 2\\\\012Line 3\\\\\\nLine 4')
+        'Line 1\\nLine 2\\nLine 3\\nLine 4'
+
+    Escaping the decoded text with escape_value gives the same text again
+
+        >>> generator = random.Random(25)
+        >>> characters = u'ab "\\\\\\n\\r\\tü\\U0001F600'
+        >>> texts = [u''.join(generator.choice(characters)
+        ...                   for _ in range(generator.randint(0, 20)))
+        ...          for _ in range(1000)]
+        >>> all(unescape_value(escape_value(text)) == text for text in texts)
+        True
+    '''
+    if '\\' not in value:
+        return value
+    text = UNESCAPE_EXPR.sub(_unescape_match, value)
+    if SURROGATE_EXPR.search(text):
+        text = text.encode('utf-16-le', 'surrogatepass').decode(
+            'utf-16-le', 'surrogatepass')
+    return text
+
+
+def _comment_text(comment):
+    '''Strips the padding of a raw comment the same way the line parser does:
+    the space after the opening and the space before the closing delimiter,
+    which LocalizedString.__str__ writes
+
+        >>> _comment_text(' Comment ')
+        'Comment'
+        >>> _comment_text(' Line 1\\n Line 2 ')
+        'Line 1\\n Line 2'
+    '''
+    if comment.startswith(' '):
+        comment = comment[1:]
+    if comment.endswith(' '):
+        comment = comment[:-1]
+    return comment
 
-def find_sources(folder_path, extensions=None, ignore_patterns=None):
-    '''Finds all source-files in the path that fit the extensions and
-    ignore-patterns
 
-    Keyword arguments:
+def parse_strings(contents):
+    ''' Parses the complete contents of a strings file in a single pass and
+        creates a dictionary containing all LocalizedStrings elements
 
-        folder_path
-            The path to the folder, all files in this folder will recursively
-            be searched
+        In contrast to LocalizedStringLineParser, the whole buffer is scanned
+        with one master pattern, so multiline values and comments need no
+        extra parsing states. Entries without a comment are kept as well.
+        Problems are stored as ParseDiagnostics in the diagnostics of the
+        table.
 
-        extensions
-            If this parameter is different to None, only files with the given
-            extension will be used
-            If None, defaults to [c, m, mm, swift]
+        Keyword arguments:
 
-        ignore_patterns
-            If this parameter is different to None, files which path match the
-            ignore pattern will be ignored
+            contents
+                The decoded contents of the strings file
 
-    Returns:
+        Returns:    ``StringsTable``
 
-        Array with paths to all files that have to be used with genstrings
+        Examples
 
-    Examples:
+            >>> strings = parse_strings(
+            ...     '/* Comment1 */\\n"key1" = "value1";\\n\\n'
+            ...     '"key2" = "value2"; /* Comment2 */\\n'
+            ...     '/* Line 1\\n Line 2 */\\n"key3" = "Line 1\\\\\\nLine 2";\\n'
+            ... )
+            >>> sorted(strings.keys())
+            ['key1', 'key2', 'key3']
+            >>> strings['key1'].value
+            'value1'
+            >>> strings['key1'].comment
+            'Comment1'
+            >>> strings['key2'].comment
+            'Comment2'
+            >>> strings['key3'].value
+            'Line 1\\\\\\nLine 2'
+            >>> strings['key3'].comment
+            'Line 1\\n Line 2'
+
+            >>> contents = ('"a" = "1";\\nkey = value\\n"a" = "";\\n'
+            ...             '"b" = "Line 1\\n')
+            >>> strings = parse_strings(contents)
+            >>> for diagnostic in strings.diagnostics:
+            ...     print(diagnostic)
+            <strings>:2: unparsed text 'key = value'
+            <strings>:3: duplicate key 'a'
+            <strings>:4: unterminated entry or comment '"b" = "Line 1'
+            >>> strings['a'].value
+            ''
+    '''
+    localized_strings = {}
+    diagnostics = []
+    previous_key = None
+    is_sorted = True
+    comment = None
+    for match in LocalizedString.TOKEN_EXPR.finditer(contents):
+        token = match.lastgroup
+        if token == 'value' or token == 'trailing_comment':
+            key = match.group('key')
+            if token == 'trailing_comment':
+                comment = _comment_text(match.group('trailing_comment'))
+            if key in localized_strings:
+                diagnostics.append(ParseDiagnostic(
+                    'duplicate', match.start('key') - 1, key
+                ))
+            localized_strings[key] = LocalizedString(
+                key, match.group('value'), comment
+            )
+            if previous_key is not None and key < previous_key:
+                is_sorted = False
+            previous_key = key
+            comment = None
+        elif token == 'comment':
+            comment = _comment_text(match.group('comment'))
+        elif token == 'unknown':
+            text = match.group('unknown').rstrip()
+            if not text:
+                # The carriage return of a last \r\n line break
+                continue
+            if LocalizedString.UNTERMINATED_EXPR.match(text):
+                kind = 'unterminated'
+            else:
+                kind = 'unparsed'
+            diagnostics.append(ParseDiagnostic(kind, match.start('unknown'),
+                                               text))
+    strings = StringsTable(localized_strings, is_sorted=is_sorted)
+    if diagnostics:
+        locate_diagnostics(diagnostics, contents)
+        strings.diagnostics = diagnostics
+    return strings
 
-        >>> find_sources('TestInput')
-        ['TestInput/test.m', 'TestInput/3rdParty/test2.m']
 
-        >>> find_sources('TestInput', ['h', 'm'])
-        ['TestInput/test.h', 'TestInput/test.m', 'TestInput/3rdParty/test2.h', 'TestInput/3rdParty/test2.m']
+def parse_lines(lines):
+    ''' Parses the lines of a strings file with a LocalizedStringLineParser
+        and creates a dictionary containing all LocalizedStrings elements
 
-        >>> find_sources('TestInput', ['h', 'm'], ['3rdParty'])
-        ['TestInput/test.h', 'TestInput/test.m']
+        Keyword arguments:
 
-        >>> find_sources('TestInput', ignore_patterns=['3rdParty'])
-        ['TestInput/test.m']
-    '''
-    # First run genstrings on all source-files
-    code_file_paths = []
-    if extensions is None:
-        extensions = frozenset(['c', 'm', 'mm', 'swift'])
+            lines
+                Iterable with the lines of the strings file
 
-    for dir_path, dir_names, file_names in os.walk(folder_path):
-        ignorePath = False
-        if ignore_patterns is not None:
-            for ignore_pattern in ignore_patterns:
-                if ignore_pattern in dir_path:
-                    logging.debug('IGNORED Path: {}'.format(dir_path))
-                    ignorePath = True
-        if ignorePath is False:
-            logging.debug('DirPath: {}'.format(dir_path))
-            for file_name in file_names:
-                extension = file_name.rpartition('.')[2]
-                if extension in extensions:
-                    code_file_path = os.path.join(dir_path, file_name)
-                    code_file_paths.append(code_file_path)
-    logging.info('Found %d files', len(code_file_paths))
-    return code_file_paths
+        Returns:    ``StringsTable``, with the same diagnostics as
+                    parse_strings
 
+        Examples
 
-def gen_strings_interface(folder_path, gen_path=None, ignore_patterns=None):
-    '''Generates strings for all interface files in the path
+            >>> lines = ['"a" = "1";\\n', 'key = value\\n', '"a" = "";\\n',
+            ...          '"b" = "Line 1\\n']
+            >>> for diagnostic in parse_lines(lines).diagnostics:
+            ...     print(diagnostic)
+            <strings>:2: unparsed text 'key = value'
+            <strings>:3: duplicate key 'a'
+            <strings>:4: unterminated entry or comment '"b" = "Line 1'
     '''
-    extensions = ['xib', 'nib', 'storyboard']
-    code_file_paths = find_sources(folder_path, extensions, ignore_patterns)
+    parser = LocalizedStringLineParser()
+    multiline_states = (parser.ParseStates['STRING_MULTILINE'],
+                        parser.ParseStates['COMMENT_MULTILINE'])
+    localized_strings = {}
+    diagnostics = []
+    previous_key = None
+    is_sorted = True
+    # (offset, line number, text) of the line a multiline value or comment
+    # started in
+    start = None
+    offset = 0
+    for (line_number, line) in enumerate(lines, 1):
+        localized_string = parser.parse_line(line)
+        if localized_string is not None:
+            key = localized_string.key
+            if key in localized_strings:
+                diagnostics.append(ParseDiagnostic(
+                    'duplicate', offset, key, line_number
+                ))
+            localized_strings[key] = localized_string
+            if previous_key is not None and key < previous_key:
+                is_sorted = False
+            previous_key = key
+            start = None
+        elif parser.unparsed:
+            diagnostics.append(ParseDiagnostic(
+                'unparsed', offset, line.strip(), line_number
+            ))
+        elif parser.parse_state in multiline_states:
+            if start is None:
+                start = (offset, line_number, line.strip())
+        else:
+            start = None
+        offset += len(line)
+    if start is not None:
+        (offset, line_number, text) = start
+        diagnostics.append(ParseDiagnostic('unterminated', offset, text,
+                                           line_number))
+    strings = StringsTable(localized_strings, is_sorted=is_sorted)
+    strings.diagnostics = diagnostics
+    return strings
+
+
+def detect_encoding(data):
+    '''Detects the encoding of the contents of a strings file from its byte
+    order mark. Without a mark, null bytes indicate UTF-16 or UTF-32 text
+    (strings files are mostly ASCII), otherwise UTF-8 is assumed.
+
+        >>> detect_encoding(codecs.BOM_UTF16_LE + u'"a" = "b";'.encode('utf-16-le'))
+        'utf-16-le'
+        >>> detect_encoding(codecs.BOM_UTF32_LE + u'"a"'.encode('utf-32-le'))
+        'utf-32-le'
+        >>> detect_encoding(u'"a" = "b";'.encode('utf-16-be'))
+        'utf-16-be'
+        >>> detect_encoding(codecs.BOM_UTF8 + b'"a" = "b";')
+        'utf-8-sig'
+        >>> detect_encoding(b'"a" = "b";')
+        'utf-8'
+    '''
+    for (byte_order_mark, encoding) in BYTE_ORDER_MARKS:
+        if data.startswith(byte_order_mark):
+            return encoding
+    sample = data[:4096]
+    if b'\x00' not in sample:
+        return 'utf-8'
+    if sample[1:4] == b'\x00\x00\x00':
+        return 'utf-32-le'
+    if sample[:3] == b'\x00\x00\x00':
+        return 'utf-32-be'
+    if sample[1::2].count(b'\x00') >= sample[::2].count(b'\x00'):
+        return 'utf-16-le'
+    return 'utf-16-be'
+
+
+def decode_contents(data, encoding=None):
+    '''Decodes the contents of a strings file
 
-    if gen_path is None:
-        gen_path = code_file_paths
+    Keyword arguments:
 
-    logging.debug('Running ibtool')
-    temp_folder_path = tempfile.mkdtemp()
+        data
+            The raw contents of the file
 
-    for code_file_path in code_file_paths:
-        (file_path, file_name) = os.path.split(code_file_path)
-        target_path = os.path.splitext(file_name)[0] + '.strings'
-        file_name = os.path.basename(code_file_path)
-        file_name = os.path.splitext(file_name)[0] + '.strings'
-        export_path = os.path.join(temp_folder_path, file_name)
-        arguments = ['ibtool', '--export-strings-file', export_path,
-                     code_file_path]
-        logging.debug('Arguments: {}'.format(arguments))
-        subprocess.call(arguments)
-        # For each file (which is a single Table) read the corresponding existing file and combine them
-        logging.debug('Temp File found: {}'.format(export_path))
-        current_file_path = os.path.join(gen_path, target_path)
-        merge_files(export_path, current_file_path, gen_path, keep_comment=True)
-        os.remove(export_path)
-    shutil.rmtree(temp_folder_path)
+        encoding
+            The encoding of the file, detected with detect_encoding if None
 
+    Returns
+        ``tuple`` with the decoded text and the encoding
 
-def gen_strings(folder_path, gen_path=None, extensions=None, ignore_patterns=None):
-    '''Runs gen-strings on all files in the path.
+        >>> (text, encoding) = decode_contents(encode_contents(u'Hello', 'utf-16-be'))
+        >>> print(text)
+        Hello
+        >>> encoding
+        'utf-16-be'
+    '''
+    if encoding is None:
+        encoding = detect_encoding(data)
+    for (byte_order_mark, mark_encoding) in BYTE_ORDER_MARKS:
+        if mark_encoding == encoding and data.startswith(byte_order_mark):
+            if encoding != 'utf-8-sig':
+                data = data[len(byte_order_mark):]
+            break
+    return (data.decode(encoding), encoding)
 
-    Keyword arguments:
 
-        folder_path
-            The path to the folder, all files in this folder will recursively
-            be searched
+def encode_contents(text, encoding=DEFAULT_ENCODING):
+    '''Encodes the contents of a strings file, UTF-16 and UTF-32 files get a
+    byte order mark
 
-        gen_path
-            The path to the folder where the LocalizedString Files should be
-            created
+        >>> encode_contents(u'a', 'utf-16-le') == codecs.BOM_UTF16_LE + b'a\\x00'
+        True
+        >>> encode_contents(u'a', 'utf-8') == b'a'
+        True
+    '''
+    return byte_order_mark(encoding) + text.encode(encoding)
 
-        extensions
-            If this parameter is different to None, only files with the given
-            extension will be used
-            If None, defaults to [c, m, mm, swift]
 
-        ignore_patterns
-            If this parameter is different to None, files which path match the
-            ignore pattern will be ignored
+def byte_order_mark(encoding):
+    '''Returns the byte order mark that is written in front of text in the
+    encoding, UTF-8 files have none and 'utf-8-sig' writes its own
+
+        >>> byte_order_mark('utf-16-le') == codecs.BOM_UTF16_LE
+        True
+        >>> byte_order_mark('utf-8') == byte_order_mark('utf-8-sig') == b''
+        True
     '''
-    code_file_paths = find_sources(folder_path, extensions, ignore_patterns)
+    for (mark, mark_encoding) in BYTE_ORDER_MARKS:
+        if mark_encoding == encoding and encoding != 'utf-8-sig':
+            return mark
+    return b''
 
-    if gen_path is None:
-        gen_path = code_file_paths
 
-    logging.debug('Running genstrings')
-    temp_folder_path = tempfile.mkdtemp()
+def parse_file(file_path, encoding=None, engine='scanner', strict=False):
+    ''' Parses a file and creates a dictionary containing all LocalizedStrings
+        elements in the file
 
-    arguments = ['genstrings', '-u', '-o', temp_folder_path]
-    arguments.extend(code_file_paths)
-    subprocess.call(arguments)
-    logging.debug('Temp Path: {}'.format(temp_folder_path))
+        The file is read once, its encoding is detected from the byte order
+        mark (see detect_encoding) and stored in the returned StringsTable.
 
-    #Read the Strings from the new generated strings
-    for temp_file in os.listdir(temp_folder_path):
-        # For each file (which is a single Table) read the corresponding existing file and combine them
-        logging.debug('Temp File found: {}'.format(temp_file))
-        temp_file_path = os.path.join(temp_folder_path, temp_file)
-        current_file_path = os.path.join(gen_path, temp_file)
-        merge_files(temp_file_path, current_file_path, gen_path)
-        os.remove(temp_file_path)
-    shutil.rmtree(temp_folder_path)
+        Keyword arguments:
 
+            file_path
+                path to the file that should be parsed
 
-def merge_files(new_file_path, old_file_path, folder_path, keep_comment=False):
-    '''Scans the Strings in both files, merges them together and writes the
-    result to the old file
+            encoding
+                encoding of the file, detected if None
 
-    Keyword Arguments
+            engine
+                The parser that is used, one of PARSER_ENGINES.
+                'scanner' parses the whole file in a single pass (see
+                parse_strings), 'line' uses the LocalizedStringLineParser
 
-        new_file_path
-            Path to the new generated strings file
+            strict
+                If True, a ParseError is raised if the file has diagnostics.
+                Otherwise they are logged as warnings.
 
-        old_file_path
+        Returns:    ``StringsTable``
+
+        Examples
+
+            >>> strings = parse_file('Localizable.strings')
+            >>> strings == parse_file('Localizable.strings', engine='line')
+            True
+            >>> for key in sorted(strings.keys()):
+            ...     print(key)
+            key1
+            key_3rd
+            multiline
+            >>> strings.encoding
+            'utf-16-le'
+
+            >>> file_path = os.path.join(tempfile.mkdtemp(), 'Test.strings')
+            >>> with open(file_path, 'wb') as strings_file:
+            ...     _ = strings_file.write(encode_contents(
+            ...         u'"a" = "1";\\n"a" = "2";\\n', 'utf-16-le'))
+            >>> try:
+            ...     parse_file(file_path, strict=True)
+            ... except ParseError as error:
+            ...     diagnostic = error.diagnostics[0]
+            >>> diagnostic.kind, diagnostic.line, diagnostic.byte_offset
+            ('duplicate', 2, 24)
+            >>> shutil.rmtree(os.path.dirname(file_path))
+    '''
+    if engine not in PARSER_ENGINES:
+        raise ValueError('Unknown parser engine: {}'.format(engine))
+
+    logging.debug("Parsing File: {}".format(file_path))
+    table_name = os.path.splitext(os.path.basename(file_path))[0]
+    with STATS.stage('parse_file', table_name) as record:
+        with open(file_path, 'rb') as file_contents:
+            data = file_contents.read()
+        (contents, encoding) = decode_contents(data, encoding)
+        logging.debug("Detected encoding: {}".format(encoding))
+        if engine == 'line':
+            # Other line breaks like U+2028 may be part of values
+            strings = parse_lines(io.StringIO(contents, newline='\n'))
+        else:
+            strings = parse_strings(contents)
+        strings.encoding = encoding
+        record['bytes_read'] += len(data)
+        record['entries'] += len(strings)
+        record['files'] += 1
+    if strings.diagnostics:
+        start = 0
+        for (mark, mark_encoding) in BYTE_ORDER_MARKS:
+            if mark_encoding == encoding and data.startswith(mark):
+                start = len(mark)
+        codec = encoding.replace('-sig', '')
+        position = 0
+        for diagnostic in strings.diagnostics:
+            start += len(contents[position:diagnostic.offset].encode(codec))
+            position = diagnostic.offset
+            diagnostic.byte_offset = start
+            diagnostic.file_path = file_path
+        if strict:
+            raise ParseError(strings.diagnostics)
+        for diagnostic in strings.diagnostics:
+            logging.warning('%s', diagnostic)
+    return strings
+
+
+def detect_file_encoding(file_path):
+    '''Detects the encoding of a strings file from its first bytes, see
+    detect_encoding
+    '''
+    with open(file_path, 'rb') as file_contents:
+        return detect_encoding(file_contents.read(4096))
+
+
+def iter_file(file_path, encoding=None, chunk_size=1 << 20):
+    '''Scans a strings file like parse_strings and yields its LocalizedStrings
+    in the order of the file, without reading the whole file into memory
+
+    The file is decoded in chunks. Entries that start in a chunk are scanned
+    with the next chunk as lookahead, so entries and comments may be split
+    across chunks as long as they are shorter than chunk_size. A
+    ``ValueError`` is raised for text that can not be scanned, which is
+    either not a valid entry or an entry that is longer than chunk_size.
+
+    Keyword arguments:
+
+        file_path
+            path to the file that should be parsed
+
+        encoding
+            encoding of the file, detected if None
+
+        chunk_size
+            Number of characters that are read at once
+
+    Examples
+
+        >>> print(', '.join(string.key for string in iter_file('Localizable.strings')))
+        key1, key_3rd, multiline
+        >>> file_path = os.path.join(tempfile.mkdtemp(), 'Test.strings')
+        >>> strings = generate_strings(50, multiline=True)
+        >>> strings['key0000007'].comment = None
+        >>> write_file(file_path, strings)
+        True
+        >>> streamed = list(iter_file(file_path, chunk_size=100))
+        >>> len(streamed), all(string == strings[string.key] for string in streamed)
+        (50, True)
+        >>> strings['key0000008'].value = 'Long ' * 100
+        >>> write_file(file_path, strings)
+        True
+        >>> list(iter_file(file_path, chunk_size=100))
+        Traceback (most recent call last):
+        ...
+        ValueError: Can not scan '"key0000008" = "Long Long...' of Test.strings, it is not a valid entry or longer than 100 characters
+        >>> len(list(iter_file(file_path, chunk_size=1000)))
+        50
+        >>> shutil.rmtree(os.path.dirname(file_path))
+    '''
+    if encoding is None:
+        encoding = detect_file_encoding(file_path)
+    token_expr = LocalizedString.TOKEN_EXPR
+    with io.open(file_path, encoding=encoding, newline='') as text:
+        buffer = text.read(chunk_size)
+        if buffer.startswith(u'\ufeff'):
+            buffer = buffer[1:]
+        comment = None
+        while buffer:
+            lookahead = text.read(chunk_size)
+            boundary = len(buffer)
+            buffer += lookahead
+            position = 0
+            for match in token_expr.finditer(buffer):
+                if lookahead and match.start() >= boundary:
+                    break
+                position = match.end()
+                token = match.lastgroup
+                if token == 'value' or token == 'trailing_comment':
+                    if token == 'trailing_comment':
+                        comment = _comment_text(match.group('trailing_comment'))
+                    yield LocalizedString(match.group('key'),
+                                          match.group('value'), comment)
+                    comment = None
+                elif token == 'comment':
+                    comment = _comment_text(match.group('comment'))
+                elif token == 'unknown' and match.group('unknown').strip():
+                    # Skipping the text would lose the entries behind it, as
+                    # a truncated entry continues past the lookahead
+                    raise ValueError(
+                        'Can not scan {!r} of {}, it is not a valid entry or '
+                        'longer than {} characters'.format(
+                            match.group('unknown')[:25] + '...',
+                            os.path.basename(file_path), chunk_size))
+            buffer = buffer[position:] if lookahead else u''
+
+
+def serialize_strings(strings):
+    '''Returns the contents of a strings file with all LocalizedStrings of the
+    dictionary, sorted alphabetically
+
+        >>> print(serialize_strings({
+        ...     'b': LocalizedString('b', 'B', 'Comment'),
+        ...     'a': LocalizedString('a', 'A', None),
+        ... }))
+        "a" = "A";
+        <BLANKLINE>
+        /* Comment */
+        "b" = "B";
+        <BLANKLINE>
+        <BLANKLINE>
+    '''
+    return ''.join(['%s\n' % string for string in sort_strings(strings)])
+
+
+def write_file(file_path, strings, encoding=None, skip_unchanged=False):
+    '''Writes the strings to the given file
+
+    Keyword arguments:
+
+        file_path
+            Path of the strings file
+
+        strings
+            Dictionary with the LocalizedStrings
+
+        encoding
+            Encoding of the file. If None, the encoding the strings were read
+            with (see StringsTable) or DEFAULT_ENCODING is used
+
+        skip_unchanged
+            If True, the file is not written when it already has exactly the
+            same contents, so its modification time stays untouched
+
+    Returns
+        ``True`` if the file was written, ``False`` if it was unchanged
+
+    Examples
+
+        >>> file_path = os.path.join(tempfile.mkdtemp(), 'Test.strings')
+        >>> strings = {'a': LocalizedString('a', 'A', 'Comment')}
+        >>> write_file(file_path, strings, skip_unchanged=True)
+        True
+        >>> write_file(file_path, strings, skip_unchanged=True)
+        False
+        >>> strings['a'].value = 'B'
+        >>> write_file(file_path, strings, skip_unchanged=True)
+        True
+        >>> shutil.rmtree(os.path.dirname(file_path))
+    '''
+    if encoding is None:
+        encoding = getattr(strings, 'encoding', DEFAULT_ENCODING)
+    table_name = os.path.splitext(os.path.basename(file_path))[0]
+    with STATS.stage('write_file', table_name) as record:
+        record['entries'] += len(strings)
+        contents = encode_contents(serialize_strings(strings), encoding)
+        if skip_unchanged and os.path.exists(file_path):
+            with open(file_path, 'rb') as existing:
+                if existing.read() == contents:
+                    logging.debug('File {} is unchanged'.format(file_path))
+                    return False
+        write_atomic(file_path, contents)
+        record['bytes_written'] += len(contents)
+        record['files'] += 1
+    return True
+
+
+# The umask can only be read by setting it, so it is read once while the
+# process has a single thread
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+
+def _fsync_directory(folder_path):
+    '''Flushes the entries of a folder to disk, e.g. after a rename. Does
+    nothing where folders cannot be opened, like on Windows.
+    '''
+    try:
+        directory = os.open(folder_path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(directory)
+    except OSError:
+        pass
+    finally:
+        os.close(directory)
+
+
+def write_atomic(file_path, contents, skip_unchanged=False):
+    '''Writes the contents to a temporary file in the same folder and moves
+    it onto file_path, so the file is either completely written or not at
+    all, even if the process dies while writing. The temporary file is
+    synced to disk before the rename and the folder after it, so a power
+    loss cannot leave an empty or truncated file either.
+
+    Keyword arguments:
+
+        file_path
+            Path of the file
+
+        contents
+            The encoded contents of the file, or an iterable of encoded
+            chunks that are written one after the other
+
+        skip_unchanged
+            If True, the temporary file is removed instead if it has the same
+            contents as the existing file
+
+    Returns
+        ``True`` if the file was written, ``False`` if it was unchanged
+
+    Examples
+
+        >>> folder_path = tempfile.mkdtemp()
+        >>> file_path = os.path.join(folder_path, 'Test.strings')
+        >>> write_atomic(file_path, b'Hello')
+        True
+        >>> write_atomic(file_path, iter([b'Wor', b'ld']))
+        True
+        >>> write_atomic(file_path, b'World', skip_unchanged=True)
+        False
+        >>> with open(file_path, 'rb') as written:
+        ...     written.read() == b'World'
+        True
+        >>> os.listdir(folder_path)
+        ['Test.strings']
+        >>> shutil.rmtree(folder_path)
+    '''
+    if isinstance(contents, bytes):
+        contents = [contents]
+    (folder_path, file_name) = os.path.split(os.path.abspath(file_path))
+    (handle, temp_path) = tempfile.mkstemp(dir=folder_path,
+                                           prefix='.' + file_name + '.')
+    try:
+        with os.fdopen(handle, 'wb') as output:
+            for chunk in contents:
+                output.write(chunk)
+            output.flush()
+            unchanged = (skip_unchanged and os.path.exists(file_path) and
+                         filecmp.cmp(temp_path, file_path, shallow=False))
+            if not unchanged:
+                os.fsync(output.fileno())
+        if unchanged:
+            logging.debug('File {} is unchanged'.format(file_path))
+            os.remove(temp_path)
+            return False
+        # mkstemp creates the file only readable by the owner
+        if os.path.exists(file_path):
+            shutil.copymode(file_path, temp_path)
+        else:
+            os.chmod(temp_path, 0o666 & ~UMASK)
+        os.replace(temp_path, file_path)
+        _fsync_directory(folder_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return True
+
+
+def strings_to_file(localized_strings, file_path, encoding=None):
+    '''
+    Write a strings file at file_path containing string in
+    the localized_strings dictionnary.
+    The strings are alphabetically sorted.
+    '''
+    write_file(file_path, localized_strings, encoding)
+
+
+def sort_strings(strings):
+    '''Returns an array that contains all LocalizedStrings objects of the
+    dictionary, sorted alphabetically. A StringsTable that is already sorted
+    is returned in its order.
+
+        >>> strings = {'b': LocalizedString('b'), 'a': LocalizedString('a')}
+        >>> [string.key for string in sort_strings(strings)]
+        ['a', 'b']
+    '''
+    if getattr(strings, 'is_sorted', False):
+        return list(strings.values())
+    return [strings[key] for key in sorted(strings)]
+
+
+class IgnoreMatcher(object):
+    ''' Decides whether a path matches any of a list of ignore patterns.
+
+    A pattern is a substring of the path by default. Patterns prefixed with
+    'glob:' are shell-style wildcards that are matched against the name of
+    each file and folder, patterns prefixed with 're:' are regular expressions
+    that are searched in the path. All patterns of a kind are compiled into a
+    single expression.
+
+    Examples
+
+        >>> matcher = IgnoreMatcher(['3rdParty', 'glob:*.generated.m', r're:/Pods(/|$)'])
+        >>> matcher.matches('Sources/3rdParty/lib.m')
+        True
+        >>> matcher.matches('Sources/View.generated.m')
+        True
+        >>> matcher.matches('Sources/Pods')
+        True
+        >>> matcher.matches('Sources/PodsHelper.m')
+        False
+        >>> IgnoreMatcher(None).matches('Sources/View.m')
+        False
+    '''
+    def __init__(self, ignore_patterns):
+        super(IgnoreMatcher, self).__init__()
+        path_expressions = []
+        name_expressions = []
+        for ignore_pattern in ignore_patterns or ():
+            if ignore_pattern.startswith('glob:'):
+                name_expressions.append(fnmatch.translate(ignore_pattern[5:]))
+            elif ignore_pattern.startswith('re:'):
+                path_expressions.append(ignore_pattern[3:])
+            else:
+                path_expressions.append(re.escape(ignore_pattern))
+        self.path_expr = None
+        self.name_expr = None
+        if path_expressions:
+            self.path_expr = re.compile(
+                '|'.join('(?:%s)' % expression for expression in path_expressions)
+            )
+        if name_expressions:
+            self.name_expr = re.compile(
+                '|'.join('(?:%s)' % expression for expression in name_expressions)
+            )
+
+    def matches(self, path, name=None):
+        '''Returns True if the path should be ignored
+
+        Keyword arguments:
+
+            path
+                The path of the file or folder
+
+            name
+                The name of the file or folder, taken from the path if None
+        '''
+        if self.path_expr is not None and self.path_expr.search(path):
+            return True
+        if self.name_expr is not None:
+            if name is None:
+                name = os.path.basename(path)
+            return self.name_expr.match(name) is not None
+        return False
+
+
+def _list_directory(dir_path):
+    '''Returns the sorted (name, is_directory) pairs of all entries of the
+    folder, symbolic links to folders are not treated as folders (like
+    os.walk does)
+    '''
+    with os.scandir(dir_path) as entries:
+        return sorted((entry.name, entry.is_dir(follow_symlinks=False))
+                      for entry in entries)
+
+
+def _run_git(folder_path, arguments):
+    '''Runs a git command in the folder and returns the NUL separated paths
+    it printed, relative to the folder
+    '''
+    command = ['git', '-C', folder_path] + arguments
+    logging.debug('Running {}'.format(' '.join(command)))
+    output = os.fsdecode(subprocess.check_output(command))
+    return [path for path in output.split('\0') if path]
+
+
+def git_sources(folder_path, extensions=None, ignore_patterns=None,
+                base_ref=None):
+    '''Finds the source-files in the path that are tracked by git, instead
+    of walking the folder. Untracked and ignored files (build products,
+    dependencies) are never looked at.
+
+    Keyword arguments:
+
+        folder_path, extensions, ignore_patterns
+            See find_sources
+
+        base_ref
+            If set, only the files that changed between this commit and the
+            working tree are returned (deleted files are left out)
+
+    Returns:
+
+        Sorted list with paths to the files, raises
+        ``subprocess.CalledProcessError`` if the folder is not in a git
+        repository
+
+    Examples:
+
+        >>> git_sources('TestInput', ['h', 'm'], ['glob:test.*'])
+        ['TestInput/3rdParty/test2.h', 'TestInput/3rdParty/test2.m']
+    '''
+    if extensions is None:
+        extensions = frozenset(['c', 'm', 'mm', 'swift'])
+    else:
+        extensions = frozenset(extensions)
+    matcher = IgnoreMatcher(ignore_patterns)
+    if matcher.matches(folder_path):
+        logging.debug('IGNORED Path: {}'.format(folder_path))
+        return []
+
+    if base_ref is None:
+        relative_paths = _run_git(folder_path, ['ls-files', '-z', '--', '.'])
+    else:
+        relative_paths = _run_git(folder_path, [
+            'diff', '--name-only', '-z', '--relative', '--diff-filter=d',
+            base_ref, '--', '.'
+        ])
+
+    # Folders are matched like find_sources would when descending into them,
+    # each folder only once
+    ignored_dirs = {'': False}
+
+    def is_ignored_dir(relative_dir):
+        if relative_dir not in ignored_dirs:
+            parent, _, name = relative_dir.rpartition('/')
+            ignored_dirs[relative_dir] = (
+                is_ignored_dir(parent) or
+                matcher.matches(os.path.join(folder_path, relative_dir), name)
+            )
+        return ignored_dirs[relative_dir]
+
+    code_file_paths = []
+    for relative_path in sorted(set(relative_paths)):
+        relative_dir, _, name = relative_path.rpartition('/')
+        path = os.path.join(folder_path, relative_path)
+        if (name.rpartition('.')[2] in extensions and
+                not is_ignored_dir(relative_dir) and
+                not matcher.matches(path, name) and os.path.isfile(path)):
+            code_file_paths.append(path)
+    logging.info('Found %d files known to git', len(code_file_paths))
+    return code_file_paths
+
+
+def find_sources(folder_path, extensions=None, ignore_patterns=None,
+                 git=False, git_base=None):
+    '''Finds all source-files in the path that fit the extensions and
+    ignore-patterns
+
+    Keyword arguments:
+
+        folder_path
+            The path to the folder, all files in this folder will recursively
+            be searched
+
+        extensions
+            If this parameter is different to None, only files with the given
+            extension will be used
+            If None, defaults to [c, m, mm, swift]
+
+        ignore_patterns
+            If this parameter is different to None, files which path match the
+            ignore pattern will be ignored, see IgnoreMatcher. Ignored folders
+            are not searched at all.
+
+        git
+            If True, the files are listed by git_sources instead of walking
+            the folder
+
+        git_base
+            If set, only the files changed since this git commit are
+            returned, see git_sources. Implies git
+
+    Returns:
+
+        Array with paths to all files that have to be used with genstrings
+
+    Examples:
+
+        >>> find_sources('TestInput')
+        ['TestInput/test.m', 'TestInput/3rdParty/test2.m']
+
+        >>> find_sources('TestInput', ['h', 'm'])
+        ['TestInput/test.h', 'TestInput/test.m', 'TestInput/3rdParty/test2.h', 'TestInput/3rdParty/test2.m']
+
+        >>> find_sources('TestInput', ['h', 'm'], ['3rdParty'])
+        ['TestInput/test.h', 'TestInput/test.m']
+
+        >>> find_sources('TestInput', ignore_patterns=['3rdParty'])
+        ['TestInput/test.m']
+
+        >>> find_sources('TestInput', ['h', 'm'], ['glob:test.*'])
+        ['TestInput/3rdParty/test2.h', 'TestInput/3rdParty/test2.m']
+
+        >>> find_sources('TestInput', git=True)
+        ['TestInput/3rdParty/test2.m', 'TestInput/test.m']
+    '''
+    if git or git_base is not None:
+        return git_sources(folder_path, extensions, ignore_patterns, git_base)
+
+    code_file_paths = []
+    if extensions is None:
+        extensions = frozenset(['c', 'm', 'mm', 'swift'])
+    else:
+        extensions = frozenset(extensions)
+    matcher = IgnoreMatcher(ignore_patterns)
+    if matcher.matches(folder_path):
+        logging.debug('IGNORED Path: {}'.format(folder_path))
+        return code_file_paths
+
+    # Depth first like os.walk, but ignored folders are pruned before
+    # descending into them
+    dir_paths = [folder_path]
+    while dir_paths:
+        dir_path = dir_paths.pop()
+        logging.debug('DirPath: {}'.format(dir_path))
+        try:
+            entries = _list_directory(dir_path)
+        except OSError as error:
+            logging.debug('Skipping {}: {}'.format(dir_path, error))
+            continue
+        sub_dir_paths = []
+        for (name, is_directory) in entries:
+            path = os.path.join(dir_path, name)
+            if is_directory:
+                if matcher.matches(path, name):
+                    logging.debug('IGNORED Path: {}'.format(path))
+                else:
+                    sub_dir_paths.append(path)
+            elif (name.rpartition('.')[2] in extensions and
+                  not matcher.matches(path, name)):
+                code_file_paths.append(path)
+        dir_paths.extend(reversed(sub_dir_paths))
+    logging.info('Found %d files', len(code_file_paths))
+    return code_file_paths
+
+
+EXTRACTORS = ('genstrings', 'native')
+CACHE_FILE_NAME = '.update_localization.cache'
+ARCHIVE_FILE_NAME = '.update_localization.archive'
+TABLE_CACHE_FILE_NAME = '.update_localization.tables'
+
+DEFAULT_TABLE = 'Localizable'
+DEFAULT_COMMENT = 'No comment provided by engineer.'
+
+# Names of the positional arguments of the localization macros. Swift calls
+# pass everything after the key as labeled arguments with the same names.
+LOCALIZATION_MACROS = {
+    'NSLocalizedString': ('key', 'comment'),
+    'NSLocalizedStringFromTable': ('key', 'tableName', 'comment'),
+    'NSLocalizedStringFromTableInBundle': ('key', 'tableName', 'bundle',
+                                           'comment'),
+    'NSLocalizedStringWithDefaultValue': ('key', 'tableName', 'bundle',
+                                          'value', 'comment'),
+}
+LOCALIZATION_CALL_EXPR = re.compile(
+    r'\b(NSLocalizedString(?:FromTableInBundle|FromTable|WithDefaultValue)?)'
+    r'\s*\('
+)
+# Objective-C (@"...") or C/Swift ("...") string literal
+STRING_LITERAL_EXPR = re.compile(r'\s*@?"((?:[^"\\\n]|\\.)*)"\s*')
+# Tokens relevant for splitting an argument list: delimiters, and string
+# literals (including Swift multiline literals), character literals and
+# comments which may contain delimiters
+ARGUMENT_TOKEN_EXPR = re.compile(
+    r'''"""(?:[^\\]|\\.)*?"""|"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*'|'''
+    r'''/\*.*?\*/|//[^\n]*|[()\[\]{},"]''',
+    re.DOTALL
+)
+# Swift escape \u{X} with 1 to 8 hex digits of a Unicode scalar, strings files
+# use \UXXXX with a UTF-16 code unit instead
+SWIFT_UNICODE_ESCAPE_EXPR = re.compile(
+    r'(?<!\\)((?:\\\\)*)\\u\{([0-9a-fA-F]{1,8})\}')
+# A Swift interpolation \( that is not preceded by an escaped backslash
+SWIFT_INTERPOLATION_EXPR = re.compile(r'(?<!\\)(?:\\\\)*\\\(')
+ARGUMENT_LABEL_EXPR = re.compile(r'\s*([A-Za-z_]\w*)\s*:(?!:)(.*)$', re.DOTALL)
+
+
+def _split_arguments(source, position):
+    '''Splits the argument list of a call into the top-level arguments.
+
+    Keyword arguments:
+
+        source
+            The source code containing the call
+
+        position
+            The position right after the opening parenthesis of the call
+
+    Returns
+        ``tuple`` with the list of raw arguments and the position after the
+        closing parenthesis or (None, position) when the list is unbalanced
+
+    Examples
+
+        >>> _split_arguments('f(@"a, b", g(1, 2), [x y:@"c"]) + 1', 2)
+        (['@"a, b"', ' g(1, 2)', ' [x y:@"c"]'], 31)
+        >>> _split_arguments('f(@"a", ', 2)
+        (None, 2)
+    '''
+    arguments = []
+    depth = 0
+    start = position
+    for match in ARGUMENT_TOKEN_EXPR.finditer(source, position):
+        token = match.group()
+        if token in '([{':
+            depth += 1
+        elif token in ')]}':
+            if depth == 0:
+                if token != ')':
+                    break
+                arguments.append(source[start:match.start()])
+                return (arguments, match.end())
+            depth -= 1
+        elif token == ',':
+            if depth == 0:
+                arguments.append(source[start:match.start()])
+                start = match.end()
+        elif token == '"':
+            # Unterminated string literal
+            break
+    return (None, position)
+
+
+def _swift_unicode_escape(match):
+    code_point = int(match.group(2), 16)
+    if code_point > 0xFFFF:
+        code_point -= 0x10000
+        code_units = (0xD800 + (code_point >> 10), 0xDC00 + (code_point & 0x3FF))
+    else:
+        code_units = (code_point,)
+    return match.group(1) + ''.join('\\U%04X' % code_unit
+                                    for code_unit in code_units)
+
+
+def _string_argument(argument, swift=False):
+    '''Returns the contents of an argument that consists only of (adjacent)
+    string literals, None for any other expression. The escape sequences are
+    kept, except that the \\u{X} escapes of Swift are written as \\UXXXX like
+    in strings files, see unescape_value.
+
+        >>> _string_argument(' @"Hello" ')
+        'Hello'
+        >>> _string_argument('@"Hello, " @"World"')
+        'Hello, World'
+        >>> _string_argument('[NSBundle mainBundle]')
+        >>> _string_argument('nil')
+        >>> print(_string_argument('"Caf\\\\u{E9} \\\\u{1F600}"', swift=True))
+        Caf\\U00E9 \\UD83D\\UDE00
+    '''
+    parts = []
+    position = 0
+    while position < len(argument):
+        match = STRING_LITERAL_EXPR.match(argument, position)
+        if match is None:
+            return None
+        parts.append(match.group(1))
+        position = match.end()
+    if not parts:
+        return None
+    if swift:
+        return SWIFT_UNICODE_ESCAPE_EXPR.sub(_swift_unicode_escape,
+                                             ''.join(parts))
+    return ''.join(parts)
+
+
+def _unsupported_swift_literal(argument):
+    '''Returns why the Swift string literal of an argument can not be
+    extracted, None if it can
+
+        >>> _unsupported_swift_literal(' """\\nLine 1\\nLine 2\\n"""')
+        'multiline'
+        >>> _unsupported_swift_literal('"Hello \\\\(name)"')
+        'interpolated'
+        >>> _unsupported_swift_literal('"Not \\\\\\\\(interpolated)"')
+    '''
+    if '"""' in argument:
+        return 'multiline'
+    literal = STRING_LITERAL_EXPR.match(argument)
+    if literal is not None and SWIFT_INTERPOLATION_EXPR.search(literal.group(1)):
+        return 'interpolated'
+    return None
+
+
+def extract_source(source, file_path=None):
+    '''Extracts the localized strings from source code, like genstrings does.
+
+    Finds NSLocalizedString, NSLocalizedStringFromTable,
+    NSLocalizedStringFromTableInBundle and NSLocalizedStringWithDefaultValue
+    calls in Objective-C/C code as well as the Swift variant
+    NSLocalizedString(_:tableName:bundle:value:comment:). Calls whose key is
+    not a string literal are skipped. In Swift files, \\u{X} escapes are
+    converted to the escapes of strings files and calls with multiline or
+    interpolated string literals are skipped with a warning.
+
+    Keyword arguments:
+
+        source
+            The source code to be scanned
+
+        file_path
+            Path of the scanned file for log messages, files ending with
+            .swift are scanned as Swift
+
+    Returns
+        ``dict`` mapping each table name to a ``dict`` with the
+        LocalizedStrings of that table
+
+    Examples
+
+        >>> tables = extract_source(
+        ...     'NSLocalizedString(@"key1", @"Comment1");\\n'
+        ...     'NSLocalizedStringFromTable(@"key2", @"Table", nil);\\n'
+        ...     'NSLocalizedString("key3", tableName: "Table", '
+        ...     'value: "Value3", comment: "Comment3")\\n'
+        ...     'NSLocalizedString(key, @"Not a literal");\\n'
+        ... )
+        >>> sorted(tables.keys())
+        ['Localizable', 'Table']
+        >>> print(tables['Localizable']['key1'])
+        /* Comment1 */
+        "key1" = "key1";
+        <BLANKLINE>
+        >>> print(tables['Table']['key2'])
+        /* No comment provided by engineer. */
+        "key2" = "key2";
+        <BLANKLINE>
+        >>> print(tables['Table']['key3'])
+        /* Comment3 */
+        "key3" = "Value3";
+        <BLANKLINE>
+        >>> logging.disable(logging.WARNING)
+        >>> tables = extract_source(
+        ...     'NSLocalizedString("Caf\\\\u{E9}", comment: "Drink")\\n'
+        ...     'NSLocalizedString("""\\nLine\\n""", comment: "Multiline")\\n'
+        ...     'NSLocalizedString("Hi \\\\(name)", comment: "Interpolated")\\n',
+        ...     'Test.swift'
+        ... )
+        >>> logging.disable(logging.NOTSET)
+        >>> print(tables['Localizable']['Caf\\\\U00E9'])
+        /* Drink */
+        "Caf\\U00E9" = "Caf\\U00E9";
+        <BLANKLINE>
+        >>> len(tables['Localizable'])
+        1
+    '''
+    swift = file_path is not None and file_path.endswith('.swift')
+    tables = {}
+    position = 0
+    while True:
+        match = LOCALIZATION_CALL_EXPR.search(source, position)
+        if match is None:
+            break
+        (arguments, position) = _split_arguments(source, match.end())
+        if arguments is None:
+            position = match.end()
+            continue
+        parameters = {}
+        unsupported = None
+        names = LOCALIZATION_MACROS[match.group(1)]
+        for index, argument in enumerate(arguments):
+            label = ARGUMENT_LABEL_EXPR.match(argument)
+            if index > 0 and label is not None:
+                (name, argument) = label.groups()
+            elif index < len(names):
+                name = names[index]
+            else:
+                continue
+            if swift and unsupported is None:
+                unsupported = _unsupported_swift_literal(argument)
+            parameters[name] = _string_argument(argument, swift)
+        if unsupported is not None:
+            logging.warning('Skipping %s in %s, its string literal is %s',
+                            match.group(1), file_path, unsupported)
+            continue
+        key = parameters.get('key')
+        if key is None:
+            logging.debug('Skipping %s without literal key in %s',
+                          match.group(1), file_path)
+            continue
+        table_name = parameters.get('tableName') or DEFAULT_TABLE
+        localized_string = LocalizedString(
+            key,
+            parameters.get('value') or key,
+            parameters.get('comment') or DEFAULT_COMMENT
+        )
+        table = tables.setdefault(table_name, {})
+        if key not in table:
+            table[key] = localized_string
+        elif table[key].comment != localized_string.comment:
+            logging.warning('Key "%s" used with multiple comments "%s" & "%s"',
+                            key, table[key].comment, localized_string.comment)
+    return tables
+
+
+def extract_file(file_path):
+    '''Extracts the localized strings from a single source file, see
+    extract_source
+    '''
+    with open(file_path, 'rb') as source:
+        data = source.read()
+    return extract_source(data.decode(detect_encoding(data), 'replace'), file_path)
+
+
+def merge_extracted(tables, file_tables):
+    '''Adds the tables extracted from one file to the tables extracted so far.
+    The first occurrence of a key wins, so the result only depends on the
+    order in which the files are merged.
+
+        >>> tables = {'Localizable': {'a': LocalizedString('a', 'a', 'first')}}
+        >>> merge_extracted(tables, {
+        ...     'Localizable': {'a': LocalizedString('a', 'a', 'second'),
+        ...                     'b': LocalizedString('b', 'b', 'b')}
+        ... })
+        >>> sorted(tables['Localizable'].keys())
+        ['a', 'b']
+        >>> tables['Localizable']['a'].comment
+        'first'
+    '''
+    for table_name, strings in file_tables.items():
+        table = tables.setdefault(table_name, {})
+        for key, localized_string in strings.items():
+            if key not in table:
+                table[key] = localized_string
+
+
+def _extract_files(file_paths):
+    '''Extracts the tables of several files, runs in the workers of
+    extract_strings
+    '''
+    return [extract_file(file_path) for file_path in file_paths]
+
+
+def extract_strings(file_paths, jobs=1, cache=None, prune=True):
+    '''Extracts the localized strings of all files without running genstrings
+
+    Keyword arguments:
+
+        file_paths
+            The source files to be scanned, e.g. from find_sources
+
+        jobs
+            Number of worker processes. If greater than 1, the files are split
+            into contiguous shards that are extracted in parallel. The partial
+            results are merged in the order of the shards, so the result is
+            the same as with a single process.
+
+        cache
+            An optional ExtractionCache. Only files that changed since they
+            were cached are extracted, the cache is updated afterwards.
+
+        prune
+            If True, files that are not in file_paths are removed from the
+            cache. Only set it if file_paths are all source files, not just
+            the changed ones.
+
+    Returns
+        ``dict`` mapping each table name to a ``dict`` with the
+        LocalizedStrings of that table
+
+    Examples
+
+        >>> tables = extract_strings(['TestInput/test.m',
+        ...                           'TestInput/3rdParty/test2.m'])
+        >>> for table_name in sorted(tables.keys()):
+        ...     print('{}: {}'.format(
+        ...         table_name, ', '.join(sorted(tables[table_name].keys()))))
+        Localizable: key1, key_3rd, multiline
+        StandardInterface: button_ok
+        >>> file_paths = find_sources('TestInput', ['h', 'm'])
+        >>> extract_strings(file_paths, jobs=2) == extract_strings(file_paths)
+        True
+        >>> cache_path = os.path.join(tempfile.mkdtemp(), CACHE_FILE_NAME)
+        >>> cache = ExtractionCache(cache_path)
+        >>> extract_strings(file_paths, cache=cache) == extract_strings(file_paths)
+        True
+        >>> extract_strings(file_paths, cache=cache) == extract_strings(file_paths)
+        True
+        >>> _ = extract_strings(file_paths[:1], cache=cache, prune=False)
+        >>> cache.lookup(file_paths[-1]) is None
+        False
+        >>> _ = extract_strings(file_paths[:1], cache=cache)
+        >>> cache.lookup(file_paths[-1]) is None
+        True
+        >>> cache.close()
+        >>> shutil.rmtree(os.path.dirname(cache_path))
+    '''
+    if cache is not None:
+        file_tables = [cache.lookup(file_path) for file_path in file_paths]
+        dirty_paths = [file_path for (file_path, tables)
+                       in zip(file_paths, file_tables) if tables is None]
+        logging.info('%d of %d files changed since the last extraction',
+                     len(dirty_paths), len(file_paths))
+    else:
+        file_tables = None
+        dirty_paths = file_paths
+
+    if jobs > 1 and len(dirty_paths) > 1:
+        # Several shards per worker to even out differently sized files
+        shard_size = max(1, -(-len(dirty_paths) // (jobs * 4)))
+        shards = [dirty_paths[index:index + shard_size]
+                  for index in range(0, len(dirty_paths), shard_size)]
+        logging.debug('Extracting %d shards with %d processes', len(shards), jobs)
+        pool = multiprocessing.Pool(jobs)
+        try:
+            extracted_tables = [tables for shard_tables
+                                in pool.map(_extract_files, shards)
+                                for tables in shard_tables]
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        extracted_tables = _extract_files(dirty_paths)
+
+    if cache is not None:
+        for (file_path, tables) in zip(dirty_paths, extracted_tables):
+            cache.store(file_path, tables)
+        if prune:
+            cache.prune(file_paths)
+        # Fill the extracted files into the gaps of the cached ones
+        extracted_tables = iter(extracted_tables)
+        file_tables = [tables if tables is not None else next(extracted_tables)
+                       for tables in file_tables]
+    else:
+        file_tables = extracted_tables
+
+    tables = {}
+    for partial in file_tables:
+        merge_extracted(tables, partial)
+    logging.info('Extracted %d tables from %d files', len(tables), len(file_paths))
+    return tables
+
+
+INTERFACE_EXTRACTORS = ('ibtool', 'native')
+
+# Attributes of interface objects that ibtool exports for localization
+LOCALIZABLE_ATTRIBUTES = ('text', 'title', 'placeholder', 'prompt',
+                          'headerTitle', 'footerTitle', 'label', 'toolTip',
+                          'paletteLabel')
+
+
+def extract_interface(file_path):
+    '''Extracts the localizable strings of a storyboard or xib file like
+    ibtool --export-strings-file does, without needing ibtool
+
+    The XML is parsed as a stream and elements are discarded as soon as they
+    are processed, so the memory does not grow with the size of the file.
+    Each localizable attribute of an object results in an entry with the
+    key "<objectID>.<property>" and a comment naming class and property.
+
+    Keyword arguments:
+
+        file_path
+            Path of the .storyboard or .xib file
+
+    Returns
+        ``dict`` with the LocalizedStrings of the file, None if the file is
+        no valid XML
+
+    Examples
+
+        >>> folder_path = tempfile.mkdtemp()
+        >>> file_path = os.path.join(folder_path, 'Main.storyboard')
+        >>> with open(file_path, 'w') as interface:
+        ...     _ = interface.write(
+        ...         '<document targetRuntime="iOS.CocoaTouch"><scenes>'
+        ...         '<label text="Hello" id="abc-12-def"/>'
+        ...         '<button id="btn-34-ghi"><state key="normal" title="OK"/></button>'
+        ...         '<segmentedControl id="seg-56-jkl"><segments>'
+        ...         '<segment title="First"/><segment title="Second"/>'
+        ...         '</segments></segmentedControl>'
+        ...         '<textView id="txt-78-mno"><string key="text">A "quote"</string></textView>'
+        ...         '</scenes></document>')
+        >>> strings = extract_interface(file_path)
+        >>> for key in sorted(strings.keys()):
+        ...     print(strings[key])
+        /* Class = "UILabel"; text = "Hello"; ObjectID = "abc-12-def"; */
+        "abc-12-def.text" = "Hello";
+        <BLANKLINE>
+        /* Class = "UIButton"; normalTitle = "OK"; ObjectID = "btn-34-ghi"; */
+        "btn-34-ghi.normalTitle" = "OK";
+        <BLANKLINE>
+        /* Class = "UISegmentedControl"; seg-56-jkl.segmentTitles[0] = "First"; ObjectID = "seg-56-jkl"; */
+        "seg-56-jkl.segmentTitles[0]" = "First";
+        <BLANKLINE>
+        /* Class = "UISegmentedControl"; seg-56-jkl.segmentTitles[1] = "Second"; ObjectID = "seg-56-jkl"; */
+        "seg-56-jkl.segmentTitles[1]" = "Second";
+        <BLANKLINE>
+        /* Class = "UITextView"; text = "A \\"quote\\""; ObjectID = "txt-78-mno"; */
+        "txt-78-mno.text" = "A \\"quote\\"";
+        <BLANKLINE>
+        >>> shutil.rmtree(folder_path)
+    '''
+    strings = {}
+    # (element, class name, object id) of all open elements
+    stack = []
+    class_prefix = 'UI'
+    segment_index = 0
+
+    def add(class_name, object_id, property_name, text, comment_name=None):
+        value = escape_value(text)
+        key = '%s.%s' % (object_id, property_name)
+        comment = 'Class = "%s"; %s = "%s"; ObjectID = "%s";' % (
+            class_name, comment_name or property_name, value, object_id
+        )
+        strings[key] = LocalizedString(key, value, comment)
+
+    try:
+        for (event, element) in ElementTree.iterparse(file_path,
+                                                      events=('start', 'end')):
+            tag = element.tag
+            if event == 'start':
+                if not stack:
+                    if element.get('targetRuntime', '').startswith('MacOSX'):
+                        class_prefix = 'NS'
+                class_name = class_prefix + tag[:1].upper() + tag[1:]
+                object_id = element.get('id')
+                stack.append((element, class_name, object_id))
+                if object_id is not None:
+                    for attribute in LOCALIZABLE_ATTRIBUTES:
+                        text = element.get(attribute)
+                        if text:
+                            add(class_name, object_id, attribute, text)
+                elif tag == 'state' and len(stack) > 1 and element.get('title'):
+                    (_, parent_class, parent_id) = stack[-2]
+                    if parent_id is not None:
+                        add(parent_class, parent_id, element.get('key') + 'Title',
+                            element.get('title'))
+                elif tag == 'segments':
+                    segment_index = 0
+                elif tag == 'segment' and len(stack) > 2:
+                    (_, control_class, control_id) = stack[-3]
+                    if control_id is not None and element.get('title'):
+                        property_name = 'segmentTitles[{}]'.format(segment_index)
+                        add(control_class, control_id, property_name,
+                            element.get('title'),
+                            '{}.{}'.format(control_id, property_name))
+                    segment_index += 1
+            else:
+                stack.pop()
+                if (tag == 'string' and element.get('key') == 'text' and stack and
+                        element.text):
+                    (_, parent_class, parent_id) = stack[-1]
+                    if parent_id is not None:
+                        add(parent_class, parent_id, 'text', element.text)
+                # Drop processed elements to keep the memory constant
+                element.clear()
+                if stack:
+                    stack[-1][0].remove(element)
+    except ElementTree.ParseError as error:
+        logging.warning('Failed to parse %s: %s', file_path, error)
+        return None
+    return strings
+
+
+def _export_interface(arguments):
+    '''Exports the strings of one interface file with ibtool, runs in the
+    worker threads of generate_interface_tables
+
+    Returns
+        ``tuple`` with the export path, the exit code of ibtool and the time
+        the export took in seconds
+    '''
+    (ibtool, code_file_path, export_path) = arguments
+    arguments = ibtool + ['--export-strings-file', export_path, code_file_path]
+    logging.debug('Arguments: {}'.format(arguments))
+    start_time = time.time()
+    return_code = subprocess.call(arguments)
+    return (export_path, return_code, time.time() - start_time)
+
+
+def generate_interface_tables(folder_path, ignore_patterns=None,
+                              engine='scanner', jobs=1, ibtool='ibtool',
+                              extractor='ibtool', git=False, git_base=None):
+    '''Exports the strings of all interface files in the path with ibtool
+
+    Keyword arguments:
+
+        folder_path
+            The path to the folder, all interface files in this folder will
+            recursively be searched
+
+        ignore_patterns
+            See find_sources
+
+        engine
+            The parser engine used to read the exported files, see parse_file
+
+        jobs
+            Number of ibtool processes that run at the same time. The exported
+            files are read in the order of the interface files afterwards.
+
+        ibtool
+            The export command, either a list of arguments or a string that
+            is split like a shell command. It is called with the arguments
+            --export-strings-file <export path> <interface file>.
+
+        extractor
+            One of INTERFACE_EXTRACTORS, 'native' uses extract_interface
+            instead of ibtool. Compiled .nib files are skipped in that case.
+
+        git, git_base
+            See find_sources
+
+    Returns
+        ``dict`` mapping the table name of each interface file to a ``dict``
+        with its LocalizedStrings
+
+    Examples
+
+        >>> folder_path = tempfile.mkdtemp()
+        >>> for name in ['Main.storyboard', 'Cell.xib', 'Other.m']:
+        ...     open(os.path.join(folder_path, name), 'w').close()
+        >>> ibtool = [sys.executable, '-c', 'import shutil, sys; '
+        ...           'shutil.copy("StandardInterface.strings", sys.argv[2])']
+        >>> tables = generate_interface_tables(folder_path, jobs=2, ibtool=ibtool)
+        >>> for table_name in sorted(tables.keys()):
+        ...     print('{}: {}'.format(table_name, ', '.join(tables[table_name])))
+        Cell: button_ok
+        Main: button_ok
+        >>> shutil.rmtree(folder_path)
+    '''
+    extensions = ['xib', 'nib', 'storyboard']
+    with STATS.stage('find_sources') as record:
+        code_file_paths = find_sources(folder_path, extensions, ignore_patterns,
+                                       git, git_base)
+        record['files'] += len(code_file_paths)
+
+    if extractor == 'native':
+        code_file_paths = [code_file_path for code_file_path in code_file_paths
+                           if not code_file_path.endswith('.nib')]
+        with STATS.stage('extract_interface') as record:
+            if jobs > 1 and len(code_file_paths) > 1:
+                pool = multiprocessing.Pool(min(jobs, len(code_file_paths)))
+                try:
+                    results = pool.map(extract_interface, code_file_paths)
+                finally:
+                    pool.close()
+                    pool.join()
+            else:
+                results = [extract_interface(code_file_path)
+                           for code_file_path in code_file_paths]
+            record['files'] += len(code_file_paths)
+            record['entries'] += sum(len(strings) for strings in results
+                                     if strings is not None)
+        tables = {}
+        for (code_file_path, strings) in zip(code_file_paths, results):
+            if strings is None:
+                continue
+            file_name = os.path.basename(code_file_path)
+            tables[os.path.splitext(file_name)[0]] = strings
+        return tables
+
+    if not isinstance(ibtool, list):
+        ibtool = shlex.split(ibtool)
+
+    logging.debug('Running ibtool')
+    temp_folder_path = tempfile.mkdtemp()
+
+    table_names = []
+    exports = []
+    for index, code_file_path in enumerate(code_file_paths):
+        file_name = os.path.basename(code_file_path)
+        table_names.append(os.path.splitext(file_name)[0])
+        # Interface files in different folders may have the same name
+        export_path = os.path.join(temp_folder_path,
+                                   '{}-{}.strings'.format(index, table_names[-1]))
+        exports.append((ibtool, code_file_path, export_path))
+
+    start_time = time.time()
+    with STATS.stage('ibtool') as record:
+        if jobs > 1 and len(exports) > 1:
+            pool = ThreadPool(min(jobs, len(exports)))
+            try:
+                results = pool.map(_export_interface, exports)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [_export_interface(export) for export in exports]
+        record['files'] += len(exports)
+    logging.info('Exported %d interface files in %.2fs', len(results),
+                 time.time() - start_time)
+
+    tables = {}
+    for (table_name, code_file_path, (export_path, return_code, duration)) \
+            in zip(table_names, code_file_paths, results):
+        logging.debug('Exported {} in {:.3f}s'.format(code_file_path, duration))
+        if return_code != 0 or not os.path.exists(export_path):
+            logging.warning('Failed to export strings of %s', code_file_path)
+            continue
+        tables[table_name] = parse_file(export_path, engine=engine)
+        os.remove(export_path)
+    if results:
+        logging.info('Slowest export took %.2fs',
+                     max(duration for (_, _, duration) in results))
+    shutil.rmtree(temp_folder_path)
+    return tables
+
+
+def gen_strings_interface(folder_path, gen_path=None, ignore_patterns=None,
+                          engine='scanner', lazy=False, jobs=1, ibtool='ibtool',
+                          extractor='ibtool', git=False, git_base=None,
+                          stream=False, retain=None, cache=False,
+                          strict=False):
+    '''Generates strings for all interface files in the path, see
+    generate_interface_tables. With git_base the removed strings are kept,
+    because only the changed files are exported.
+    '''
+    if gen_path is None:
+        gen_path = folder_path
+
+    tables = generate_interface_tables(folder_path, ignore_patterns, engine,
+                                       jobs, ibtool, extractor, git, git_base)
+    log_written(merge_tables(tables, gen_path, keep_comment=True,
+                             engine=engine, lazy=lazy,
+                             keep_removed=git_base is not None, stream=stream,
+                             retain=retain, cache=cache, strict=strict))
+
+
+def generate_tables(folder_path, extensions=None, ignore_patterns=None,
+                    engine='scanner', extractor='genstrings', jobs=1,
+                    cache_path=None, git=False, git_base=None):
+    '''Extracts the strings of all source files in the path
+
+    Keyword arguments:
+
+        folder_path, extensions, ignore_patterns, engine, extractor, jobs
+            See gen_strings
+
+        git, git_base
+            See find_sources
+
+        cache_path
+            If set, the native extractor keeps an ExtractionCache at this path
+
+    Returns
+        ``dict`` mapping each table name to a ``dict`` with the
+        LocalizedStrings of that table
+    '''
+    with STATS.stage('find_sources') as record:
+        code_file_paths = find_sources(folder_path, extensions, ignore_patterns,
+                                       git, git_base)
+        record['files'] += len(code_file_paths)
+
+    if extractor == 'native':
+        extraction_cache = None
+        if cache_path is not None:
+            cache_folder_path = os.path.dirname(cache_path)
+            if cache_folder_path and not os.path.exists(cache_folder_path):
+                os.makedirs(cache_folder_path)
+            extraction_cache = ExtractionCache(cache_path)
+        try:
+            with STATS.stage('extract_strings') as record:
+                # Only the changed files are found relative to a git base,
+                # so the cache entries of the others must be kept
+                tables = extract_strings(code_file_paths, jobs, extraction_cache,
+                                         prune=git_base is None)
+                record['files'] += len(code_file_paths)
+                record['entries'] += sum(len(strings)
+                                         for strings in tables.values())
+            return tables
+        finally:
+            if extraction_cache is not None:
+                extraction_cache.close()
+
+    return run_genstrings(code_file_paths, engine)
+
+
+def run_genstrings(file_paths, engine='scanner'):
+    '''Extracts the strings of the source files with genstrings
+
+    Keyword arguments:
+
+        file_paths
+            The source files to be scanned
+
+        engine
+            The parser engine used to read the generated files, see
+            parse_file
+
+    Returns
+        ``dict`` mapping each table name to a ``dict`` with the
+        LocalizedStrings of that table
+    '''
+    logging.debug('Running genstrings')
+    temp_folder_path = tempfile.mkdtemp()
+
+    arguments = ['genstrings', '-u', '-o', temp_folder_path]
+    arguments.extend(file_paths)
+    with STATS.stage('genstrings') as record:
+        subprocess.call(arguments)
+        record['files'] += len(file_paths)
+    logging.debug('Temp Path: {}'.format(temp_folder_path))
+
+    #Read the Strings from the new generated strings
+    tables = {}
+    for temp_file in os.listdir(temp_folder_path):
+        logging.debug('Temp File found: {}'.format(temp_file))
+        temp_file_path = os.path.join(temp_folder_path, temp_file)
+        tables[os.path.splitext(temp_file)[0]] = parse_file(temp_file_path,
+                                                            engine=engine)
+        os.remove(temp_file_path)
+    shutil.rmtree(temp_folder_path)
+    return tables
+
+
+def merge_tables(tables, gen_path, keep_comment=False, engine='scanner',
+                 lazy=False, keep_removed=False, stream=False, retain=None,
+                 cache=False, strict=False):
+    '''Merges each table into the corresponding strings file in gen_path
+
+    Keyword arguments:
+
+        tables
+            ``dict`` mapping table names to the new strings of the table
+
+        gen_path
+            The folder with the strings files
+
+        keep_comment, engine, lazy, keep_removed, stream, strict
+            See merge_table
+
+        retain
+            If set, removed strings are kept in a RetentionArchive in gen_path
+            for this many seconds and restored when they are used again
+
+        cache
+            If True, the parsed strings files are kept in a TableCache in
+            gen_path, so unchanged files are not parsed again in the next run
+
+    Returns
+        List with the results of merge_table for each table
+
+    Examples
+
+        >>> gen_path = tempfile.mkdtemp()
+        >>> write_file(os.path.join(gen_path, 'Localizable.strings'),
+        ...            {'a': LocalizedString('a', 'A', 'Comment'),
+        ...             'b': LocalizedString('b', 'B', 'Comment')})
+        True
+        >>> tables = {'Localizable': {'b': LocalizedString('b', 'b', 'Comment')}}
+        >>> merge_tables(tables, gen_path, retain=3600)
+        [True]
+        >>> tables['Localizable']['a'] = LocalizedString('a', 'a', 'Comment')
+        >>> merge_tables(tables, gen_path, retain=3600)
+        [True]
+        >>> strings = parse_file(os.path.join(gen_path, 'Localizable.strings'))
+        >>> print(', '.join(strings[key].value for key in sorted(strings.keys())))
+        A, B
+        >>> shutil.rmtree(gen_path)
+    '''
+    archive = None
+    if retain is not None:
+        archive = RetentionArchive(os.path.join(gen_path, ARCHIVE_FILE_NAME),
+                                   retain)
+    table_cache = None
+    if cache and os.path.isdir(gen_path):
+        table_cache = TableCache(os.path.join(gen_path, TABLE_CACHE_FILE_NAME))
+    written = []
+    for table_name in sorted(tables.keys()):
+        # For each Table read the corresponding existing file and combine them
+        current_file_path = os.path.join(gen_path, table_name + '.strings')
+        written.append(merge_table(tables[table_name], current_file_path,
+                                   gen_path, keep_comment, engine=engine,
+                                   lazy=lazy, keep_removed=keep_removed,
+                                   stream=stream, archive=archive,
+                                   table_cache=table_cache, strict=strict))
+    if archive is not None:
+        archive.save()
+    if table_cache is not None:
+        table_cache.save()
+    return written
+
+
+def gen_strings(folder_path, gen_path=None, extensions=None, ignore_patterns=None,
+                engine='scanner', extractor='genstrings', jobs=1,
+                cache=False, lazy=False, git=False, git_base=None,
+                stream=False, retain=None, strict=False):
+    '''Runs gen-strings on all files in the path.
+
+    Keyword arguments:
+
+        folder_path
+            The path to the folder, all files in this folder will recursively
+            be searched
+
+        gen_path
+            The path to the folder where the LocalizedString Files should be
+            created
+
+        extensions
+            If this parameter is different to None, only files with the given
+            extension will be used
+            If None, defaults to [c, m, mm, swift]
+
+        ignore_patterns
+            If this parameter is different to None, files which path match the
+            ignore pattern will be ignored
+
+        engine
+            The parser engine used to read the strings files, see parse_file
+
+        extractor
+            How the strings are extracted from the sources, one of EXTRACTORS.
+            'genstrings' runs the genstrings tool (macOS only), 'native'
+            uses extract_strings and merges the tables in memory
+
+        jobs
+            Number of processes used by the native extractor
+
+        cache
+            If True, the native extractor keeps an ExtractionCache in gen_path
+            and only re-scans source files that changed since the last run.
+            The parsed strings files are kept in a TableCache as well.
+
+        lazy
+            If True, existing strings files are opened as LazyStringsTable
+
+        git
+            If True, only the source files tracked by git are searched
+
+        git_base
+            If set, only the source files changed since this git commit are
+            searched. Strings that are not found are kept in that case,
+            because they may still be used in the unchanged files
+
+        stream
+            If True, existing strings files are merged with merge_stream
+
+        retain
+            If set, removed strings are archived for this many seconds, see
+            merge_tables
+
+        strict
+            If True, the merge stops with a ParseError at the first strings
+            file that has diagnostics, see parse_file
+    '''
+    if gen_path is None:
+        gen_path = folder_path
+
+    cache_path = None
+    if cache:
+        cache_path = os.path.join(gen_path, CACHE_FILE_NAME)
+    tables = generate_tables(folder_path, extensions, ignore_patterns, engine,
+                             extractor, jobs, cache_path, git, git_base)
+    log_written(merge_tables(tables, gen_path, engine=engine, lazy=lazy,
+                             keep_removed=git_base is not None, stream=stream,
+                             retain=retain, cache=cache, strict=strict))
+
+
+# Folder of base internationalization, see find_locales
+BASE_LOCALE_FOLDER = 'Base.lproj'
+
+
+def find_locales(root_path, include_base=False):
+    '''Finds all localization folders (*.lproj) below the root path
+
+    Keyword arguments:
+
+        root_path
+            The folder that is searched recursively, localization folders are
+            not searched further
+
+        include_base
+            If True, the Base.lproj folders of base internationalization are
+            included as well. They hold the interface files, not translated
+            tables, so they are skipped by default.
+
+    Returns
+        Sorted list with the paths of the localization folders
+
+    Examples
+
+        >>> root_path = tempfile.mkdtemp()
+        >>> for folder in ['en.lproj', 'Sub/de.lproj', 'Sub/Other', 'Base.lproj']:
+        ...     os.makedirs(os.path.join(root_path, folder))
+        >>> for path in find_locales(root_path):
+        ...     print(os.path.relpath(path, root_path))
+        Sub/de.lproj
+        en.lproj
+        >>> len(find_locales(root_path, include_base=True))
+        3
+        >>> shutil.rmtree(root_path)
+    '''
+    locale_paths = []
+    for dir_path, dir_names, file_names in os.walk(root_path):
+        for dir_name in list(dir_names):
+            if dir_name.endswith('.lproj'):
+                if dir_name != BASE_LOCALE_FOLDER or include_base:
+                    locale_paths.append(os.path.join(dir_path, dir_name))
+                dir_names.remove(dir_name)
+    return sorted(locale_paths)
+
+
+def locale_name(folder_path):
+    '''Returns the name of the locale of a localization folder, other folders
+    are named by their path
+
+        >>> locale_name('Resources/de.lproj/')
+        'de'
+        >>> locale_name('Resources/')
+        'Resources'
+    '''
+    folder_path = os.path.normpath(folder_path)
+    name = os.path.basename(folder_path)
+    if name.endswith('.lproj'):
+        return name[:-len('.lproj')]
+    return folder_path
+
+
+def _merge_locale(arguments):
+    '''Merges all tables into one localization folder, runs in the workers of
+    merge_locales
+    '''
+    (tables, locale_path, keep_comment, engine, lazy, keep_removed,
+     stream, retain, cache, strict) = arguments
+    logging.debug('Merging locale {}'.format(locale_path))
+    return merge_tables(tables, locale_path, keep_comment, engine, lazy,
+                        keep_removed, stream, retain, cache, strict)
+
+
+def _merge_locale_worker(arguments):
+    '''Runs _merge_locale in a worker process and returns its results
+    together with the Stats and the KeyIndex entries it recorded, so they can
+    be added to those of the main process
+    '''
+    (arguments, index_enabled) = arguments
+    STATS.clear()
+    KEY_INDEX.clear()
+    KEY_INDEX.enabled = index_enabled
+    return (_merge_locale(arguments), STATS.records, KEY_INDEX.entries)
+
+
+def merge_locales(tables, locale_paths, keep_comment=False, engine='scanner',
+                  lazy=False, jobs=1, keep_removed=False, stream=False,
+                  retain=None, cache=False, strict=False):
+    '''Merges the same new tables into the strings files of every locale
+
+    Keyword arguments:
+
+        tables
+            ``dict`` mapping table names to the new strings of the table
+
+        locale_paths
+            The localization folders, e.g. from find_locales
+
+        keep_comment, engine, lazy, keep_removed, stream, strict
+            See merge_table
+
+        retain, cache
+            See merge_tables, each locale has its own archive and cache
+
+        jobs
+            Number of processes, each process merges whole locales
+
+    Returns
+        List with the results of merge_table for each table of each locale
+
+    Examples
+
+        >>> root_path = tempfile.mkdtemp()
+        >>> locale_paths = [os.path.join(root_path, locale)
+        ...                 for locale in ('de.lproj', 'en.lproj')]
+        >>> os.makedirs(locale_paths[0])
+        >>> write_file(os.path.join(locale_paths[0], 'Localizable.strings'),
+        ...            {'key1': LocalizedString('key1', 'Wert1', 'Comment')})
+        True
+        >>> tables = {'Localizable': {
+        ...     'key1': LocalizedString('key1', 'key1', 'Comment'),
+        ...     'key2': LocalizedString('key2', 'key2', 'Comment')}}
+        >>> merge_locales(tables, locale_paths, jobs=2)
+        [True, True]
+        >>> for locale_path in locale_paths:
+        ...     strings = parse_file(os.path.join(locale_path, 'Localizable.strings'))
+        ...     print(', '.join(strings[key].value for key in sorted(strings.keys())))
+        Wert1, key2
+        key1, key2
+        >>> shutil.rmtree(root_path)
+    '''
+    arguments = [(tables, locale_path, keep_comment, engine, lazy, keep_removed,
+                  stream, retain, cache, strict)
+                 for locale_path in locale_paths]
+    if jobs > 1 and len(locale_paths) > 1:
+        pool = multiprocessing.Pool(min(jobs, len(locale_paths)))
+        try:
+            results = []
+            for (locale_written, records, entries) in pool.map(
+                    _merge_locale_worker,
+                    [(argument, KEY_INDEX.enabled) for argument in arguments]):
+                results.append(locale_written)
+                STATS.update(records)
+                KEY_INDEX.update(entries)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [_merge_locale(argument) for argument in arguments]
+    return [written for locale_written in results for written in locale_written]
+
+
+def gen_strings_locales(folder_path, root_path, extensions=None,
+                        ignore_patterns=None, engine='scanner',
+                        extractor='genstrings', jobs=1, cache=False,
+                        lazy=False, interface=False, ibtool='ibtool',
+                        interface_extractor='ibtool', git=False,
+                        git_base=None, stream=False, retain=None,
+                        strict=False, include_base=False):
+    '''Extracts the strings once and merges them into every localization
+    folder (*.lproj) below root_path
+
+    Keyword arguments:
+
+        root_path
+            The folder that contains the localization folders
+
+        include_base
+            See find_locales
+
+        interface
+            If True, the strings of the interface files are merged as well
+
+        ibtool
+            See generate_interface_tables
+
+        interface_extractor
+            The extractor argument of generate_interface_tables
+
+        All other arguments see gen_strings
+    '''
+    locale_paths = find_locales(root_path, include_base)
+    logging.info('Found %d locales', len(locale_paths))
+
+    cache_path = None
+    if cache:
+        cache_path = os.path.join(root_path, CACHE_FILE_NAME)
+    keep_removed = git_base is not None
+    tables = generate_tables(folder_path, extensions, ignore_patterns, engine,
+                             extractor, jobs, cache_path, git, git_base)
+    written = merge_locales(tables, locale_paths, engine=engine, lazy=lazy,
+                            jobs=jobs, keep_removed=keep_removed, stream=stream,
+                            retain=retain, cache=cache, strict=strict)
+    if interface:
+        tables = generate_interface_tables(folder_path, ignore_patterns, engine,
+                                           jobs, ibtool, interface_extractor,
+                                           git, git_base)
+        written.extend(merge_locales(tables, locale_paths, keep_comment=True,
+                                     engine=engine, lazy=lazy, jobs=jobs,
+                                     keep_removed=keep_removed, stream=stream,
+                                     retain=retain, cache=cache, strict=strict))
+    log_written(written)
+
+
+def log_written(written):
+    '''Logs how many tables were written and how many were left untouched
+
+    Keyword arguments:
+
+        written
+            List with the results of merge_table/merge_files for each table
+    '''
+    logging.info('Wrote %d tables, %d unchanged', written.count(True),
+                 written.count(False))
+
+
+# Columns of the files written by export_strings
+EXPORT_COLUMNS = ('table', 'locale', 'key', 'value', 'comment', 'raw')
+
+
+def _locale_paths(root_path, include_base=False):
+    '''Returns the localization folders below root_path, or root_path itself
+    if it has none, see find_locales
+    '''
+    return find_locales(root_path, include_base) or [root_path]
+
+
+def export_strings(root_path, export_path, untranslated=False,
+                   include_base=False):
+    '''Writes the strings of all tables of all locales below root_path into a
+    single CSV file with the columns EXPORT_COLUMNS. Keys and comments are
+    written as they are in the strings files, values without their escape
+    sequences (see LocalizedString.text), so translators do not have to
+    escape quotes or line breaks. raw is 1 for strings that are not
+    translated yet (see LocalizedString.is_raw).
+
+    Keyword arguments:
+
+        root_path
+            The folder with the localization folders, or a single folder
+            with strings files
+
+        export_path
+            Path of the CSV file
+
+        untranslated
+            If True, only the strings that are not translated are exported
+
+        include_base
+            See find_locales
+
+    Returns
+        Number of exported strings
+
+    Examples
+
+        >>> root_path = tempfile.mkdtemp()
+        >>> os.makedirs(os.path.join(root_path, 'de.lproj'))
+        >>> write_file(os.path.join(root_path, 'de.lproj', 'Localizable.strings'), {
+        ...     'Cancel': LocalizedString('Cancel', 'Abbrechen', 'Button'),
+        ...     'OK': LocalizedString('OK', 'OK', 'Button')})
+        True
+        >>> export_path = os.path.join(root_path, 'export.csv')
+        >>> export_strings(root_path, export_path, untranslated=True)
+        1
+        >>> with open(export_path) as export_file:
+        ...     print(export_file.read().strip())
+        table,locale,key,value,comment,raw
+        Localizable,de,OK,OK,Button,1
+        >>> shutil.rmtree(root_path)
+    '''
+    count = 0
+    with STATS.stage('export') as record, \
+            open(export_path, 'w', newline='', encoding='utf-8') as export_file:
+        writer = csv.writer(export_file)
+        writer.writerow(EXPORT_COLUMNS)
+        for locale_path in _locale_paths(root_path, include_base):
+            locale = locale_name(locale_path)
+            for file_name in sorted(os.listdir(locale_path)):
+                if not file_name.endswith('.strings'):
+                    continue
+                table_name = file_name[:-len('.strings')]
+                strings = parse_file(os.path.join(locale_path, file_name))
+                for localized_string in sort_strings(strings):
+                    raw = localized_string.is_raw()
+                    if untranslated and not raw:
+                        continue
+                    writer.writerow((table_name, locale, localized_string.key,
+                                     localized_string.text,
+                                     localized_string.comment or '', int(raw)))
+                    count += 1
+        record['entries'] += count
+    logging.info('Exported %d strings to %s', count, export_path)
+    return count
+
+
+def import_strings(root_path, import_path, include_base=False):
+    '''Applies the translations of a file written by export_strings to the
+    strings files of the locales below root_path. Each strings file is read
+    and written once. The translations are merged like old strings with
+    merge_strings: they replace the values of the strings that are still in
+    the file, unless they are not translated themselves. Comments and keys
+    are taken from the strings file. The values are escaped with
+    escape_value, as export_strings writes them without escape sequences.
+
+    Keyword arguments:
+
+        root_path
+            See export_strings
+
+        import_path
+            Path of the CSV file
+
+        include_base
+            See find_locales
+
+    Returns
+        List with the results of write_file for each table
+
+    Examples
+
+        >>> root_path = tempfile.mkdtemp()
+        >>> file_path = os.path.join(root_path, 'Localizable.strings')
+        >>> write_file(file_path, {
+        ...     'Cancel': LocalizedString('Cancel', 'Cancel', 'Button'),
+        ...     'OK': LocalizedString('OK', 'OK', 'Button')})
+        True
+        >>> import_path = os.path.join(root_path, 'import.csv')
+        >>> with open(import_path, 'w') as import_file:
+        ...     _ = import_file.write('table,locale,key,value,comment,raw\\n'
+        ...                           'Localizable,%s,Cancel,Abbrechen,,0\\n'
+        ...                           'Localizable,%s,Gone,Weg,,0\\n'
+        ...                           'Localizable,%s,OK,"Sag ""OK"" \\\\o/",,0\\n'
+        ...                           % (root_path, root_path, root_path))
+        >>> import_strings(root_path, import_path)
+        [True]
+        >>> strings = parse_file(file_path)
+        >>> print(', '.join(strings[key].value for key in sorted(strings.keys())))
+        Abbrechen, Sag \\"OK\\" \\\\o/
+        >>> print(strings['OK'].text)
+        Sag "OK" \\o/
+        >>> shutil.rmtree(root_path)
+    '''
+    locale_paths = dict((locale_name(locale_path), locale_path)
+                        for locale_path in _locale_paths(root_path,
+                                                         include_base))
+    translations = {}
+    with STATS.stage('import') as record, \
+            open(import_path, newline='', encoding='utf-8') as import_file:
+        for row in csv.DictReader(import_file):
+            table = translations.setdefault((row['locale'], row['table']), {})
+            table[row['key']] = LocalizedString(row['key'],
+                                                escape_value(row['value']),
+                                                row['comment'] or None)
+            record['entries'] += 1
+
+    written = []
+    for (locale, table_name) in sorted(translations):
+        if locale not in locale_paths:
+            logging.warning('Skipping unknown locale %s', locale)
+            continue
+        file_path = os.path.join(locale_paths[locale], table_name + '.strings')
+        if not os.path.exists(file_path):
+            logging.warning('Skipping missing table %s', file_path)
+            continue
+        strings = parse_file(file_path)
+        table = translations[(locale, table_name)]
+        for key, localized_string in strings.items():
+            translation = table.get(key)
+            if (translation is not None and
+                    translation.text == localized_string.text):
+                # Unchanged values keep the escape sequences of the file
+                translation.value = localized_string.value
+        merged = merge_strings(table, strings)
+        merged.encoding = strings.encoding
+        written.append(write_file(file_path, merged, skip_unchanged=True))
+    return written
+
+
+def merge_files(new_file_path, old_file_path, folder_path, keep_comment=False,
+                engine='scanner', lazy=False):
+    '''Scans the Strings in both files, merges them together and writes the
+    result to the old file
+
+    Keyword Arguments
+
+        new_file_path
+            Path to the new generated strings file
+
+        old_file_path
             Path to the existing strings file
+
+        engine
+            The parser engine used to read both files, see parse_file
+
+        lazy
+            See merge_table
+
+    Returns
+        ``True`` if the existing file was written, ``False`` if its contents
+        did not change
     '''
-    new_strings = parse_file(new_file_path)
     logging.debug('Current File: {}'.format(old_file_path))
     if os.path.exists(old_file_path):
-        logging.debug('File Exists, merge them')
-        old_strings = parse_file(old_file_path)
-        final_strings = merge_strings(old_strings, new_strings, keep_comment)
-        write_file(old_file_path, final_strings)
+        new_strings = parse_file(new_file_path, engine=engine)
+        return merge_table(new_strings, old_file_path, folder_path,
+                           keep_comment, engine=engine, lazy=lazy)
     else:
         logging.info('File {} is new'.format(new_file_path))
         if not os.path.exists(folder_path):
             logging.info('Creating path {} because it does not exist yet.'.format(folder_path))
             os.makedirs(folder_path)
         shutil.copy(new_file_path, folder_path)
+        return True
+
+
+def merge_stream(new_strings, old_file_path, keep_comment=False,
+                 keep_removed=False):
+    '''Merges the new strings into a strings file that is sorted by key, as
+    written by write_file, without parsing it into a dictionary. The file is
+    read with iter_file and the result is written one string at a time with
+    merge_sorted.
+
+    Keyword arguments:
+
+        new_strings
+            Dictionary with the new Strings of the table
+
+        old_file_path
+            Path to the existing strings file
+
+        keep_comment, keep_removed
+            See merge_strings
+
+    Returns
+        ``True`` if the file was written, ``False`` if the merge did not
+        change its contents. Raises ``ValueError`` if the existing file is not
+        sorted or can not be scanned by iter_file, the file is left untouched
+        in that case.
+
+    Examples
+
+        >>> file_path = os.path.join(tempfile.mkdtemp(), 'Localizable.strings')
+        >>> old_strings = {'a': LocalizedString('a', 'A', 'Comment'),
+        ...                'b': LocalizedString('b', 'b', 'Comment')}
+        >>> write_file(file_path, old_strings)
+        True
+        >>> new_strings = {'b': LocalizedString('b', 'b', 'New'),
+        ...                'c': LocalizedString('c', 'c', 'New')}
+        >>> merged = merge_strings(parse_file(file_path), new_strings)
+        >>> merge_stream(new_strings, file_path)
+        True
+        >>> parse_file(file_path) == merged
+        True
+        >>> merge_stream(new_strings, file_path)
+        False
+        >>> shutil.rmtree(os.path.dirname(file_path))
+    '''
+    table_name = os.path.splitext(os.path.basename(old_file_path))[0]
+    locale = locale_name(os.path.dirname(old_file_path) or os.curdir)
+    encoding = detect_file_encoding(old_file_path)
+    with STATS.stage('merge_stream', table_name) as record:
+        merged = merge_sorted(iter_file(old_file_path, encoding),
+                              (new_strings[key] for key in sorted(new_strings)),
+                              keep_comment, keep_removed)
+        encoder = codecs.getincrementalencoder(encoding)()
+
+        def chunks():
+            yield byte_order_mark(encoding)
+            for localized_string in merged:
+                record['entries'] += 1
+                KEY_INDEX.add(table_name, locale, localized_string)
+                yield encoder.encode('%s\n' % localized_string)
+            yield encoder.encode(u'', True)
+
+        written = write_atomic(old_file_path, chunks(), skip_unchanged=True)
+        record['bytes_read'] += os.path.getsize(old_file_path)
+        if written:
+            record['bytes_written'] += os.path.getsize(old_file_path)
+            record['files'] += 1
+    return written
+
+
+def merge_table(new_strings, old_file_path, folder_path, keep_comment=False,
+                engine='scanner', lazy=False, keep_removed=False,
+                stream=False, archive=None, table_cache=None, strict=False):
+    '''Merges the new strings of a table into the existing strings file and
+    writes the result to it. If the file does not exist yet, it is created
+    with the new strings.
+
+    Keyword Arguments
+
+        new_strings
+            Dictionary with the new Strings of the table
+
+        old_file_path
+            Path to the existing strings file
+
+        folder_path
+            The folder the strings file is located in
+
+        keep_comment, keep_removed
+            See merge_strings
+
+        engine
+            The parser engine used to read the existing file, see parse_file
+
+        lazy
+            If True, the existing file is opened as LazyStringsTable instead
+            of being parsed completely
+
+        stream
+            If True, the existing file is merged with merge_stream. Files
+            that are not sorted by key are merged in memory instead.
+
+        archive
+            A RetentionArchive for the removed strings of the folder. Tables
+            are always merged in memory if it is set.
+
+        table_cache
+            A TableCache of the folder, used to read the existing file unless
+            it is opened lazily or streamed
+
+        strict
+            If True, the existing file is always parsed completely and a
+            ParseError is raised if it has diagnostics, see parse_file
+
+    Returns
+        ``True`` if the file was written, ``False`` if the merge did not
+        change its contents, in which case the file is left untouched
+    '''
+    logging.debug('Current File: {}'.format(old_file_path))
+    table_name = os.path.splitext(os.path.basename(old_file_path))[0]
+    if (os.path.exists(old_file_path) and stream and archive is None and
+            not strict):
+        try:
+            return merge_stream(new_strings, old_file_path, keep_comment,
+                                keep_removed)
+        except ValueError as error:
+            logging.info('Merging %s in memory: %s', old_file_path, error)
+            # The strings streamed before the error are indexed again
+            KEY_INDEX.discard(table_name, locale_name(folder_path))
+    if os.path.exists(old_file_path):
+        logging.debug('File Exists, merge them')
+        if lazy and not strict:
+            with LazyStringsTable(old_file_path) as old_strings:
+                with STATS.stage('merge_strings', table_name) as record:
+                    final_strings = merge_strings(old_strings, new_strings,
+                                                  keep_comment, keep_removed)
+                    if archive is not None:
+                        archive.apply(table_name, old_strings, final_strings)
+        else:
+            if table_cache is not None:
+                old_strings = table_cache.parse_file(old_file_path, engine,
+                                                     strict)
+            else:
+                old_strings = parse_file(old_file_path, engine=engine,
+                                         strict=strict)
+            with STATS.stage('merge_strings', table_name) as record:
+                final_strings = merge_strings(old_strings, new_strings,
+                                              keep_comment, keep_removed)
+                if archive is not None:
+                    archive.apply(table_name, old_strings, final_strings)
+        record['entries'] += len(final_strings)
+    else:
+        logging.info('File {} is new'.format(old_file_path))
+        if not os.path.exists(folder_path):
+            logging.info('Creating path {} because it does not exist yet.'.format(folder_path))
+            os.makedirs(folder_path)
+        final_strings = new_strings
+        if archive is not None:
+            final_strings = StringsTable(new_strings)
+            archive.apply(table_name, {}, final_strings)
+    KEY_INDEX.add_table(table_name, locale_name(folder_path), final_strings)
+    written = write_file(old_file_path, final_strings, skip_unchanged=True)
+    if written and table_cache is not None:
+        # Parsing the written file may not give exactly final_strings (e.g.
+        # empty comments are not written), so it is parsed again in the
+        # next run
+        table_cache.discard(old_file_path)
+    return written
+
+
+class StringsWatcher(object):
+    ''' Keeps the extracted strings and the strings tables in memory and only
+    re-extracts the source files that changed since the last poll. Only the
+    tables that contain strings of changed files are merged again.
+
+    Keyword arguments:
+
+        folder_path, extensions, ignore_patterns, git
+            See find_sources
+
+        gen_paths
+            The folders with the strings files, e.g. the output folder or
+            all localization folders from find_locales
+
+        engine, strict
+            The parser engine used to read the strings files and whether
+            they must parse without diagnostics, see parse_file
+
+        extractor
+            How the changed source files are extracted: native with
+            extract_file or genstrings with run_genstrings
+
+        retain
+            If set, removed strings are kept in a RetentionArchive in each
+            gen path for this many seconds, see merge_tables
+
+    Examples
+
+        >>> folder_path = tempfile.mkdtemp()
+        >>> source_path = os.path.join(folder_path, 'test.m')
+        >>> _ = shutil.copy('TestInput/test.m', source_path)
+        >>> watcher = StringsWatcher(folder_path, [folder_path], retain=3600)
+        >>> watcher.poll()
+        [True, True]
+        >>> watcher.poll()
+        []
+        >>> with open(source_path, 'a') as source:
+        ...     _ = source.write('NSLocalizedString(@"new", nil);')
+        >>> watcher.poll()
+        [True, False]
+        >>> strings = parse_file(os.path.join(folder_path, 'Localizable.strings'))
+        >>> print(', '.join(sorted(strings.keys())))
+        key1, multiline, new
+        >>> strings['new'].value = 'Neu'
+        >>> write_file(os.path.join(folder_path, 'Localizable.strings'), strings)
+        True
+        >>> _ = shutil.copy('TestInput/test.m', source_path)
+        >>> watcher.poll()
+        [True, False]
+        >>> with open(source_path, 'a') as source:
+        ...     _ = source.write('NSLocalizedString(@"new", nil);')
+        >>> watcher.poll()
+        [True, False]
+        >>> strings = parse_file(os.path.join(folder_path, 'Localizable.strings'))
+        >>> print(strings['new'].value)
+        Neu
+        >>> shutil.rmtree(folder_path)
+    '''
+
+    def __init__(self, folder_path, gen_paths, extensions=None,
+                 ignore_patterns=None, engine='scanner', git=False,
+                 extractor='native', strict=False, retain=None):
+        super(StringsWatcher, self).__init__()
+        self.folder_path = folder_path
+        self.gen_paths = gen_paths
+        self.extensions = extensions
+        self.ignore_patterns = ignore_patterns
+        self.engine = engine
+        self.git = git
+        self.extractor = extractor
+        self.strict = strict
+        self.retain = retain
+        self.file_paths = []
+        # source path -> ((mtime, size), extracted tables)
+        self.sources = {}
+        # strings file path -> ((mtime, size), StringsTable)
+        self.strings_files = {}
+
+    @staticmethod
+    def signature(file_path):
+        '''Returns the modification time and size of the file, or None if it
+        does not exist
+        '''
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        return (stat.st_mtime, stat.st_size)
+
+    def update_sources(self):
+        '''Extracts the source files that were added or changed and forgets
+        the removed ones
+
+        Returns
+            ``set`` with the names of the tables that changed
+        '''
+        file_paths = find_sources(self.folder_path, self.extensions,
+                                  self.ignore_patterns, self.git)
+        changed_tables = set()
+        for file_path in set(self.sources) - set(file_paths):
+            logging.debug('Removed {}'.format(file_path))
+            changed_tables.update(self.sources.pop(file_path)[1])
+        for file_path in file_paths:
+            signature = self.signature(file_path)
+            known = self.sources.get(file_path)
+            if signature is None or (known is not None and known[0] == signature):
+                continue
+            logging.debug('Extracting {}'.format(file_path))
+            if self.extractor == 'native':
+                tables = extract_file(file_path)
+            else:
+                tables = run_genstrings([file_path], self.engine)
+            if known is not None:
+                changed_tables.update(known[1])
+            changed_tables.update(tables)
+            self.sources[file_path] = (signature, tables)
+        self.file_paths = file_paths
+        return changed_tables
+
+    def read_strings(self, file_path):
+        '''Returns the strings of the strings file, they are only parsed again
+        if the file was changed by someone else
+        '''
+        signature = self.signature(file_path)
+        known = self.strings_files.get(file_path)
+        if known is not None and known[0] == signature:
+            return known[1]
+        logging.debug('Reading {}'.format(file_path))
+        return parse_file(file_path, engine=self.engine, strict=self.strict)
+
+    def merge(self, table_name, new_strings, archives=None):
+        '''Merges the new strings of a table into the strings files of all
+        gen_paths and remembers the result
+
+        Keyword arguments:
+
+            archives
+                ``dict`` mapping the gen paths to their RetentionArchive
+
+        Returns
+            List with the results of write_file for each gen path
+        '''
+        written = []
+        for gen_path in self.gen_paths:
+            archive = (archives or {}).get(gen_path)
+            file_path = os.path.join(gen_path, table_name + '.strings')
+            if os.path.exists(file_path):
+                old_strings = self.read_strings(file_path)
+                final_strings = merge_strings(old_strings, new_strings)
+            else:
+                if not os.path.exists(gen_path):
+                    os.makedirs(gen_path)
+                old_strings = {}
+                final_strings = StringsTable(new_strings, DEFAULT_ENCODING)
+            if archive is not None:
+                archive.apply(table_name, old_strings, final_strings)
+            written.append(write_file(file_path, final_strings,
+                                      skip_unchanged=True))
+            self.strings_files[file_path] = (self.signature(file_path),
+                                             final_strings)
+        return written
+
+    def poll(self):
+        '''Checks the sources once and merges the tables that changed
+
+        Returns
+            List with the results of write_file for each merged table
+        '''
+        changed_tables = self.update_sources()
+        if not changed_tables:
+            return []
+        # Rebuild the changed tables from the files in the order of
+        # find_sources, so the first occurrence of a key wins as in
+        # extract_strings
+        tables = {}
+        for file_path in self.file_paths:
+            file_tables = self.sources.get(file_path)
+            if file_tables is None:
+                continue
+            merge_extracted(tables, dict(
+                (table_name, strings)
+                for table_name, strings in file_tables[1].items()
+                if table_name in changed_tables
+            ))
+        archives = {}
+        if self.retain is not None:
+            # Created for each poll, so the archives evict by the current time
+            archives = dict(
+                (gen_path, RetentionArchive(
+                    os.path.join(gen_path, ARCHIVE_FILE_NAME), self.retain))
+                for gen_path in self.gen_paths
+            )
+        written = []
+        for table_name in sorted(tables):
+            written.extend(self.merge(table_name, tables[table_name], archives))
+        for archive in archives.values():
+            archive.save()
+        return written
+
+    def run(self, interval=1.0):
+        '''Polls the sources every interval seconds until interrupted'''
+        logging.info('Watching {}, press Ctrl+C to stop'.format(self.folder_path))
+        try:
+            while True:
+                start_time = time.time()
+                written = self.poll()
+                if written:
+                    log_written(written)
+                    logging.info('Merged in %.3fs', time.time() - start_time)
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            logging.info('Stopped watching')
+
+
+# -- Benchmarks ----------------------------------------------------------------
+
+
+def benchmark_memory(count=100000):
+    '''Measures the memory used by count LocalizedString objects and compares
+    it to the same objects with a per-instance __dict__, which is how
+    LocalizedString was implemented before it used __slots__
+
+    Keyword arguments:
+
+        count
+            Number of objects that are created
+
+    Returns
+        ``dict`` with the bytes used by the objects of both implementations
+
+    Examples
+
+        >>> result = benchmark_memory(1000)
+        >>> result['slots_bytes'] < result['dict_bytes']
+        True
+    '''
+    class DictLocalizedString(object):
+        def __init__(self, key, value=None, comment=None):
+            self.key = key
+            self.value = value
+            self.comment = comment
+
+    entries = [('key%d' % index, 'value%d' % index, 'comment%d' % index)
+               for index in range(count)]
+    result = {'entries': count}
+    for (name, cls) in (('dict_bytes', DictLocalizedString),
+                        ('slots_bytes', LocalizedString)):
+        tracemalloc.start()
+        objects = [cls(*entry) for entry in entries]
+        result[name] = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del objects
+    result['bytes_per_entry'] = {
+        'dict': result['dict_bytes'] / float(count),
+        'slots': result['slots_bytes'] / float(count),
+    }
+    return result
+
+
+def generate_strings(count, multiline=False):
+    '''Generates count LocalizedStrings with non-ASCII values and comments,
+    every tenth value spans several lines if multiline is True
+
+        >>> strings = generate_strings(20, multiline=True)
+        >>> len(strings), len(strings['key0000010'].value.splitlines())
+        (20, 3)
+    '''
+    strings = {}
+    for index in range(count):
+        key = 'key%07d' % index
+        value = u'Wert üäö %d' % index
+        if multiline and index % 10 == 0:
+            value = u'%s\nZeile 2\nZeile 3' % value
+        strings[key] = LocalizedString(key, value, 'Comment for entry %d' % index)
+    return strings
+
+
+def generate_escaped_strings(count, seed=0):
+    '''Generates count LocalizedStrings with random keys, values and comments
+    full of escape sequences, quotes, line breaks and characters outside the
+    BMP, the same for the same seed
+
+    Writing them and parsing the file with either engine gives the same
+    strings, and writing those again gives the same bytes
+
+        >>> strings = generate_escaped_strings(1000, seed=25)
+        >>> file_path = os.path.join(tempfile.mkdtemp(), 'Test.strings')
+        >>> for encoding in ('utf-8', 'utf-16-le'):
+        ...     _ = write_file(file_path, strings, encoding)
+        ...     with open(file_path, 'rb') as strings_file:
+        ...         contents = strings_file.read()
+        ...     for engine in PARSER_ENGINES:
+        ...         parsed = parse_file(file_path, engine=engine)
+        ...         print(encoding, engine, parsed == strings,
+        ...               write_file(file_path, parsed, skip_unchanged=True))
+        utf-8 scanner True False
+        utf-8 line True False
+        utf-16-le scanner True False
+        utf-16-le line True False
+        >>> shutil.rmtree(os.path.dirname(file_path))
+    '''
+    generator = random.Random(seed)
+    key_pieces = [u'key', u'ü', u' ', u'=', u';', u'\\"', u'\\\\', u'\\n',
+                  u'\\U00FC']
+    value_pieces = key_pieces + [u'Wert', u'/*', u'*/', u"'", u'%@',
+                                 u'\U0001F600', u'\\UD83D\\UDE00', u'\\t',
+                                 u'\\012', u'\n', u'\r\n', u'\\\n']
+    comment_pieces = [u'Comment', u'für', u'"quoted"', u'%@', u'\\n']
+
+    def join(pieces, length):
+        return u''.join(generator.choice(pieces) for _ in range(length))
+
+    strings = {}
+    for index in range(count):
+        key = u'%s%d' % (join(key_pieces, generator.randint(0, 3)), index)
+        comment = None
+        if generator.random() < 0.9:
+            comment = u''.join(
+                generator.choice(comment_pieces) + generator.choice(u' \n')
+                for _ in range(generator.randint(0, 3))
+            ) + u'entry %d' % index
+        strings[key] = LocalizedString(
+            key, join(value_pieces, generator.randint(0, 8)), comment
+        )
+    return strings
+
+
+def generate_sources(folder_path, file_count, strings_per_file=10,
+                     files_per_folder=20):
+    '''Writes a synthetic source tree with file_count Objective-C and Swift
+    files into the folder, in two levels of folders with files_per_folder
+    entries each
+
+        >>> folder_path = tempfile.mkdtemp()
+        >>> generate_sources(folder_path, 50)
+        >>> len(find_sources(folder_path))
+        50
+        >>> len(extract_strings(find_sources(folder_path))['Localizable'])
+        500
+        >>> shutil.rmtree(folder_path)
+    '''
+    for index in range(file_count):
+        if index % files_per_folder == 0:
+            folder = index // files_per_folder
+            dir_path = os.path.join(folder_path,
+                                    'Group%d' % (folder // files_per_folder),
+                                    'Group%d' % (folder % files_per_folder))
+            os.makedirs(dir_path)
+        if index % 2:
+            name = 'File%d.swift' % index
+            call = u'NSLocalizedString("%s", comment: "%s")\n'
+        else:
+            name = 'File%d.m' % index
+            call = u'NSLocalizedString(@"%s", @"%s");\n'
+        lines = [call % ('source%d_%d' % (index, number), 'Comment')
+                 for number in range(strings_per_file)]
+        with codecs.open(os.path.join(dir_path, name), 'w', 'utf-8') as source:
+            source.write(u''.join(lines))
+        # Files that are not sources, find_sources has to skip them
+        open(os.path.join(dir_path, 'File%d.h' % index), 'w').close()
+
+
+def _best_time(function, repeat, *args, **kwargs):
+    '''Calls the function repeat times and returns the shortest duration in
+    seconds together with the last result
+    '''
+    durations = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        result = function(*args, **kwargs)
+        durations.append(time.perf_counter() - start_time)
+    return (min(durations), result)
+
+
+def benchmark_tables(sizes=(1000, 10000, 100000),
+                     encodings=('utf-8', 'utf-16-le'), multiline=True,
+                     repeat=3):
+    '''Times parse_file with both engines, merge_strings, sort_strings and
+    write_file on generated tables of each size and encoding
+
+    Returns
+        List with one ``dict`` of timings in seconds per size and encoding
+
+        >>> results = benchmark_tables(sizes=[100], encodings=['utf-8'], repeat=1)
+        >>> sorted(results[0].keys())  # doctest: +NORMALIZE_WHITESPACE
+        ['bytes', 'encoding', 'entries', 'merge_strings', 'multiline',
+         'parse_file_line', 'parse_file_scanner', 'sort_strings', 'write_file']
+    '''
+    results = []
+    folder_path = tempfile.mkdtemp()
+    try:
+        for count in sizes:
+            old_strings = generate_strings(count, multiline)
+            # The new strings are raw and every tenth key is new
+            new_strings = {}
+            for index, key in enumerate(sorted(old_strings)):
+                if index % 10 == 0:
+                    key = 'new' + key
+                new_strings[key] = LocalizedString(key, key, 'New comment')
+            for encoding in encodings:
+                file_path = os.path.join(folder_path, 'Benchmark.strings')
+                result = {'entries': count, 'encoding': encoding,
+                          'multiline': multiline}
+                result['write_file'] = _best_time(write_file, repeat, file_path,
+                                                  old_strings, encoding)[0]
+                result['bytes'] = os.path.getsize(file_path)
+                for engine in PARSER_ENGINES:
+                    (duration, parsed) = _best_time(parse_file, repeat,
+                                                    file_path, engine=engine)
+                    result['parse_file_' + engine] = duration
+                result['merge_strings'] = _best_time(merge_strings, repeat,
+                                                     parsed, new_strings)[0]
+                result['sort_strings'] = _best_time(sort_strings, repeat,
+                                                    parsed)[0]
+                logging.debug('Benchmarked {} entries ({})'.format(count, encoding))
+                results.append(result)
+    finally:
+        shutil.rmtree(folder_path)
+    return results
+
+
+def benchmark_escapes(count=100000, repeat=3):
+    '''Times both parser engines on a table from generate_escaped_strings
+    and unescape_value on its values
+
+    Returns
+        ``dict`` with the durations in seconds and the throughput of each
+        engine in MB/s and of unescape_value in values per second
+
+        >>> result = benchmark_escapes(100, repeat=1)
+        >>> sorted(result.keys())  # doctest: +NORMALIZE_WHITESPACE
+        ['bytes', 'entries', 'parse_file_line', 'parse_file_scanner',
+         'throughput', 'unescape_value']
+    '''
+    strings = generate_escaped_strings(count)
+    folder_path = tempfile.mkdtemp()
+    try:
+        file_path = os.path.join(folder_path, 'Benchmark.strings')
+        write_file(file_path, strings)
+        result = {'entries': count, 'bytes': os.path.getsize(file_path),
+                  'throughput': {}}
+        for engine in PARSER_ENGINES:
+            name = 'parse_file_' + engine
+            (result[name], parsed) = _best_time(parse_file, repeat, file_path,
+                                                engine=engine)
+            result['throughput'][name] = (result['bytes'] / 1e6 /
+                                          max(result[name], 1e-9))
+        values = [string.value for string in parsed.values()]
+        result['unescape_value'] = _best_time(
+            lambda: [unescape_value(value) for value in values], repeat)[0]
+        result['throughput']['unescape_value'] = (
+            count / max(result['unescape_value'], 1e-9))
+    finally:
+        shutil.rmtree(folder_path)
+    return result
+
+
+def benchmark_sources(file_counts=(100, 1000, 10000), repeat=3):
+    '''Times find_sources and the native extract_strings on generated source
+    trees with each number of files
+
+    Returns
+        List with one ``dict`` of timings in seconds per tree
+    '''
+    results = []
+    for file_count in file_counts:
+        folder_path = tempfile.mkdtemp()
+        try:
+            generate_sources(folder_path, file_count)
+            (duration, file_paths) = _best_time(find_sources, repeat, folder_path)
+            results.append({
+                'files': file_count,
+                'find_sources': duration,
+                'extract_strings': _best_time(extract_strings, repeat,
+                                              file_paths)[0],
+            })
+        finally:
+            shutil.rmtree(folder_path)
+    return results
+
+
+def run_benchmarks(sizes=None, repeat=3):
+    '''Runs all benchmarks and returns their results
+
+    Keyword arguments:
+
+        sizes
+            Numbers of entries of the generated tables, defaults to the sizes
+            of benchmark_tables. The source trees get a tenth as many files.
+
+        repeat
+            How often each measurement is repeated, the best time is reported
+    '''
+    if sizes is None:
+        sizes = (1000, 10000, 100000)
+    logging.info('Running benchmarks for %s entries', ', '.join(map(str, sizes)))
+    return {
+        'python': sys.version.split()[0],
+        'memory': benchmark_memory(),
+        'tables': benchmark_tables(sizes, repeat=repeat),
+        'escapes': benchmark_escapes(max(sizes), repeat),
+        'sources': benchmark_sources([max(1, size // 10) for size in sizes],
+                                     repeat),
+    }
 
 
 def main():
@@ -960,6 +4765,30 @@ def main():
         default=False,
         help='Run unit tests (debug)'
     )
+    parser.add_option(
+        '--benchmark',
+        action='store_true',
+        dest='benchmark',
+        default=False,
+        help='Run the benchmarks and print the results as JSON'
+    )
+    parser.add_option(
+        '--benchmark-sizes',
+        action='store',
+        dest='benchmark_sizes',
+        default=None,
+        metavar='SIZES',
+        help='Comma separated numbers of entries of the generated tables, '
+             'e.g. 1000,10000,1000000'
+    )
+    parser.add_option(
+        '--benchmark-repeat',
+        action='store',
+        type='int',
+        dest='benchmark_repeat',
+        default=3,
+        help='How often each benchmark is repeated, the best time is reported'
+    )
     parser.add_option(
         '--ignore',
         action='append',
@@ -974,6 +4803,22 @@ def main():
         default=None,
         help='File-Extensions that should be scanned'
     )
+    parser.add_option(
+        '--all-locales',
+        action='store_true',
+        dest='all_locales',
+        default=False,
+        help='Treat the output path as root and update every *.lproj folder '
+             'below it, the sources are only scanned once'
+    )
+    parser.add_option(
+        '--include-base',
+        action='store_true',
+        dest='include_base',
+        default=False,
+        help='Also update Base.lproj folders with --all-locales, --export and '
+             '--import'
+    )
     parser.add_option(
         '--interface',
         action='store_true',
@@ -981,8 +4826,208 @@ def main():
         default=False,
         help='Also Localize Interface files'
     )
+    parser.add_option(
+        '--ibtool',
+        action='store',
+        dest='ibtool',
+        default='ibtool',
+        help='Command used to export the strings of interface files, it is '
+             'called with --export-strings-file <output> <interface file>'
+    )
+    parser.add_option(
+        '--interface-extractor',
+        action='store',
+        type='choice',
+        choices=INTERFACE_EXTRACTORS,
+        dest='interface_extractor',
+        default='ibtool',
+        help='How strings are extracted from interface files: ibtool '
+             '(default, macOS only) or native (built-in, runs everywhere)'
+    )
+    parser.add_option(
+        '--parser',
+        action='store',
+        type='choice',
+        choices=PARSER_ENGINES,
+        dest='parser_engine',
+        default='scanner',
+        help='Parser used for .strings files: scanner (single pass, default) '
+             'or line (line by line)'
+    )
+    parser.add_option(
+        '--strict',
+        action='store_true',
+        dest='strict',
+        default=False,
+        help='Stop with an error if an existing .strings file has unparsed '
+             'text, unterminated entries or duplicate keys, instead of '
+             'warning about them'
+    )
+    parser.add_option(
+        '--extractor',
+        action='store',
+        type='choice',
+        choices=EXTRACTORS,
+        dest='extractor',
+        default='genstrings',
+        help='How strings are extracted from the sources: genstrings '
+             '(default, macOS only) or native (built-in, runs everywhere)'
+    )
+    parser.add_option(
+        '-j',
+        '--jobs',
+        action='store',
+        type='int',
+        dest='jobs',
+        default=1,
+        help='Number of processes used by the native extractor and for merging '
+             'the locales with --all-locales, number of parallel ibtool exports'
+    )
+    parser.add_option(
+        '--lazy',
+        action='store_true',
+        dest='lazy',
+        default=False,
+        help='Memory map existing .strings files and only read the entries '
+             'that are needed (for very large tables)'
+    )
+    parser.add_option(
+        '--stream',
+        action='store_true',
+        dest='stream',
+        default=False,
+        help='Merge existing .strings files while reading them instead of '
+             'loading them completely (for very large sorted tables)'
+    )
+    parser.add_option(
+        '--cache',
+        action='store_true',
+        dest='cache',
+        default=False,
+        help='Keep caches of the extracted strings and of the parsed .strings '
+             'files in the output folder, so only changed sources (native '
+             'extractor) and changed .strings files are read again'
+    )
+    parser.add_option(
+        '--git',
+        action='store_true',
+        dest='git',
+        default=False,
+        help='Only scan the files tracked by git instead of walking the '
+             'input path'
+    )
+    parser.add_option(
+        '--git-base',
+        action='store',
+        dest='git_base',
+        default=None,
+        metavar='REF',
+        help='Only scan the files changed since the git commit REF, strings '
+             'that are not found are kept'
+    )
+    parser.add_option(
+        '--stats',
+        action='store_true',
+        dest='stats',
+        default=False,
+        help='Print the time and counters of each stage and table at the end'
+    )
+    parser.add_option(
+        '--stats-json',
+        action='store',
+        dest='stats_json',
+        default=None,
+        metavar='PATH',
+        help='Write the time and counters of each stage and table as JSON to '
+             'PATH, - for stdout'
+    )
+    parser.add_option(
+        '--profile',
+        action='store',
+        dest='profile',
+        default=None,
+        metavar='PATH',
+        help='Run with cProfile, save the profile to PATH and print the '
+             'slowest functions'
+    )
+    parser.add_option(
+        '--retain',
+        action='store',
+        type='float',
+        dest='retain_days',
+        default=None,
+        metavar='DAYS',
+        help='Keep removed strings in an archive next to the strings files '
+             'for DAYS days and restore their translations when they are '
+             'used again'
+    )
+    parser.add_option(
+        '--export',
+        action='store',
+        dest='export_path',
+        default=None,
+        metavar='PATH',
+        help='Write the strings of all tables of all locales below the output '
+             'path to the CSV file PATH instead of updating them'
+    )
+    parser.add_option(
+        '--export-untranslated',
+        action='store_true',
+        dest='export_untranslated',
+        default=False,
+        help='Only export the strings that are not translated yet'
+    )
+    parser.add_option(
+        '--import',
+        action='store',
+        dest='import_path',
+        default=None,
+        metavar='PATH',
+        help='Apply the translations of the CSV file PATH (see --export) to '
+             'the locales below the output path instead of updating them'
+    )
+    parser.add_option(
+        '--index-report',
+        action='store',
+        dest='index_report',
+        default=None,
+        metavar='PATH',
+        help='Index the keys of all merged tables and write the keys used in '
+             'several tables, conflicting values and keys missing per locale '
+             'as JSON to PATH, - for stdout'
+    )
+    parser.add_option(
+        '--watch',
+        action='store_true',
+        dest='watch',
+        default=False,
+        help='Keep running and merge the tables again whenever source files '
+             'change (interface files are not watched, the tables are kept in '
+             'memory instead of using --cache, --lazy or --stream)'
+    )
+    parser.add_option(
+        '--watch-interval',
+        action='store',
+        type='float',
+        dest='watch_interval',
+        default=1.0,
+        metavar='SECONDS',
+        help='How often the sources are checked in watch mode'
+    )
 
     (options, args) = parser.parse_args()
+    if options.watch:
+        for (name, value) in [('--interface', options.interface),
+                              ('--cache', options.cache),
+                              ('--lazy', options.lazy),
+                              ('--stream', options.stream),
+                              ('--git-base', options.git_base)]:
+            if value:
+                parser.error('{} can not be used with --watch'.format(name))
+    if options.stats_json == '-' and options.index_report == '-':
+        # Two JSON documents on stdout could not be parsed
+        parser.error('--stats-json and --index-report can not both write to '
+                     'stdout')
 
     # Create Logger
     logging.basicConfig(
@@ -995,15 +5040,147 @@ def main():
         doctest.testmod()
         return
 
+    if options.benchmark:
+        sizes = None
+        if options.benchmark_sizes:
+            sizes = [int(size) for size in options.benchmark_sizes.split(',')]
+        print(json.dumps(run_benchmarks(sizes, options.benchmark_repeat),
+                         indent=2, sort_keys=True))
+        return
+
+    KEY_INDEX.enabled = options.index_report is not None
+    start_time = time.time()
+    try:
+        if options.profile:
+            profiler = cProfile.Profile()
+            result = profiler.runcall(run, options)
+            profiler.dump_stats(options.profile)
+            pstats.Stats(profiler, stream=sys.stderr).sort_stats(
+                'cumulative').print_stats(20)
+        else:
+            result = run(options)
+    except ParseError as error:
+        logging.error('%s', error)
+        result = 1
+    report_stats(options, time.time() - start_time)
+    if options.index_report:
+        report_index(options.index_report)
+    return result
+
+
+def report_index(path):
+    '''Writes the report of the KEY_INDEX as JSON to path, - for stdout'''
+    report = KEY_INDEX.report()
+    logging.info('Indexed %d keys: %d in several tables, %d with conflicting '
+                 'values, %d locales with missing keys', report['keys'],
+                 len(report['duplicates']), len(report['conflicts']),
+                 len(report['missing']))
+    contents = json.dumps(report, indent=2, sort_keys=True)
+    if path == '-':
+        print(contents)
+    else:
+        with open(path, 'w') as report_file:
+            report_file.write(contents)
+
+
+def report_stats(options, duration):
+    '''Reports the STATS of the run as requested by the options'''
+    if options.stats:
+        logging.info('%s\nTotal %.3fs', STATS.summary(), duration)
+    if options.stats_json:
+        contents = json.dumps({'seconds': duration, 'stages': STATS.rows()},
+                              indent=2, sort_keys=True)
+        if options.stats_json == '-':
+            print(contents)
+        else:
+            with open(options.stats_json, 'w') as stats_file:
+                stats_file.write(contents)
+
+
+def run(options):
+    '''Updates the strings files as requested by the command line options'''
+    retain = None
+    if options.retain_days is not None:
+        retain = options.retain_days * 24 * 60 * 60
+
+    if options.export_path:
+        export_strings(options.output_path, options.export_path,
+                       options.export_untranslated, options.include_base)
+        return 0
+
+    if options.import_path:
+        log_written(import_strings(options.output_path, options.import_path,
+                                   options.include_base))
+        return 0
+
+    if options.watch:
+        if options.all_locales:
+            gen_paths = find_locales(options.output_path,
+                                     options.include_base)
+        else:
+            gen_paths = [options.output_path]
+        watcher = StringsWatcher(options.input_path, gen_paths,
+                                 extensions=options.extensions,
+                                 ignore_patterns=options.ignore_patterns,
+                                 engine=options.parser_engine,
+                                 git=options.git,
+                                 extractor=options.extractor,
+                                 strict=options.strict,
+                                 retain=retain)
+        watcher.run(options.watch_interval)
+        return 0
+
+    if options.all_locales:
+        gen_strings_locales(folder_path=options.input_path,
+                            root_path=options.output_path,
+                            extensions=options.extensions,
+                            ignore_patterns=options.ignore_patterns,
+                            engine=options.parser_engine,
+                            extractor=options.extractor,
+                            jobs=options.jobs,
+                            cache=options.cache,
+                            lazy=options.lazy,
+                            interface=options.interface,
+                            ibtool=options.ibtool,
+                            interface_extractor=options.interface_extractor,
+                            git=options.git,
+                            git_base=options.git_base,
+                            stream=options.stream,
+                            retain=retain,
+                            strict=options.strict,
+                            include_base=options.include_base)
+        return 0
+
     gen_strings(folder_path=options.input_path,
                 gen_path=options.output_path,
                 extensions=options.extensions,
-                ignore_patterns=options.ignore_patterns)
+                ignore_patterns=options.ignore_patterns,
+                engine=options.parser_engine,
+                extractor=options.extractor,
+                jobs=options.jobs,
+                cache=options.cache,
+                lazy=options.lazy,
+                git=options.git,
+                git_base=options.git_base,
+                stream=options.stream,
+                retain=retain,
+                strict=options.strict)
 
     if options.interface:
         gen_strings_interface(folder_path=options.input_path,
                               gen_path=options.output_path,
-                              ignore_patterns=options.ignore_patterns)
+                              ignore_patterns=options.ignore_patterns,
+                              engine=options.parser_engine,
+                              lazy=options.lazy,
+                              jobs=options.jobs,
+                              ibtool=options.ibtool,
+                              extractor=options.interface_extractor,
+                              git=options.git,
+                              git_base=options.git_base,
+                              stream=options.stream,
+                              retain=retain,
+                              cache=options.cache,
+                              strict=options.strict)
     return 0
 
 if __name__ == '__main__':